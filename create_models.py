@@ -1,20 +1,100 @@
 #!/usr/bin/env python3
+import gc
+import glob
+import heapq
+import json
+import os
+import pickle
+import random
 import re
-from collections import Counter
+import sys
+import tempfile
+from bisect import bisect_left, bisect_right
+from collections import Counter, deque
+from contextlib import contextmanager
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from itertools import accumulate, islice
+
+import numpy as np
+
 from fibonnaci_syllables import (
     fibonacci_sequence_unique, 
     best_syllable_split, 
     generate_fibonacci_bidirectional_multi
 )
+from fibonacci_instrumentation import get_instrumentation, timed
+from fibonacci_word_store import (
+    MappedWordModel,
+    RankedWordModel,
+    RelatedWordIndex,
+    SharedWordModel,
+    build_distance_arrays,
+    build_ranked_candidate_index,
+    convert_pickle_model,
+    is_binary_word_model,
+    load_word_model,
+    merge_into_binary_word_model,
+    pair_score_index,
+    prune_binary_word_model,
+    score_mutual_candidates,
+    stable_group_order,
+    write_word_model_binary
+)
+
+
+WORD_PATTERN = re.compile(r'\b[a-zA-Z]+\b')
 
 
 def text_to_words(file_path):
+    return list(iter_text_words(file_path))
+
+
+def _trailing_word_run_start(text):
+    # same notion of "word character" as \w, which decides where \b can match
+    split = len(text)
+    while split and (text[split - 1].isalnum() or text[split - 1] == '_'):
+        split -= 1
+    return split
+
+
+def iter_text_words(file_path, chunk_size=1 << 20):
     with open(file_path, 'r', encoding='utf-8') as f:
-        text = f.read()
-    
-    words = re.findall(r'\b[a-zA-Z]+\b', text.lower())
+        carry = ''
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                break
+            text = carry + chunk.lower()
+            # a trailing run of word characters may continue in the next chunk, so hold it back
+            split = _trailing_word_run_start(text)
+            carry = text[split:]
+            yield from WORD_PATTERN.findall(text, 0, split)
+        yield from WORD_PATTERN.findall(carry)
+
+
+def expand_corpus_paths(sources, pattern='*.txt'):
+    if isinstance(sources, (str, os.PathLike)):
+        sources = [sources]
     
-    return [word for word in words if word]
+    paths = []
+    for source in map(os.fspath, sources):
+        if os.path.isdir(source):
+            matches = sorted(glob.glob(os.path.join(source, '**', pattern), recursive=True))
+        elif any(char in source for char in '*?['):
+            matches = sorted(glob.glob(source, recursive=True))
+        else:
+            matches = [source]
+        if not matches:
+            raise FileNotFoundError(f"No corpus files match {source!r}")
+        paths.extend(matches)
+    return paths
+
+
+def iter_corpus_documents(sources, chunk_size=1 << 20):
+    # one word stream per file; pairs never cross from one file into the next
+    for path in expand_corpus_paths(sources):
+        yield iter_text_words(path, chunk_size)
 
 
 def fibonacci_sequence_unique_no_pos1(max_val: int) -> list[int]:
@@ -24,147 +104,707 @@ def fibonacci_sequence_unique_no_pos1(max_val: int) -> list[int]:
     return [f for f in fib if f <= max_val]
 
 
-def create_fibonacci_bidirectional_word_model(words, max_distance=200):
-    print(f"📊 Building bidirectional WORD model from {len(words)} words...")
+def lucas_sequence_unique_no_pos1(max_val):
+    lucas = [2, 1, 3]
+    while lucas[-1] < max_val:
+        lucas.append(lucas[-1] + lucas[-2])
+    return sorted(l for l in set(lucas) if 2 <= l <= max_val)
+
+
+INTERVAL_SEQUENCES = {
+    'fibonacci': fibonacci_sequence_unique_no_pos1,
+    'lucas': lucas_sequence_unique_no_pos1,
+}
+
+
+def interval_config(distances='fibonacci', weights=None, max_distance=200):
+    # distances: a name from INTERVAL_SEQUENCES or an explicit list; weights: {distance: multiplier}
+    # applied to candidate scores from that distance at generation time
+    if isinstance(distances, str):
+        if distances not in INTERVAL_SEQUENCES:
+            raise ValueError(f"Unknown interval sequence {distances!r} (expected one of {sorted(INTERVAL_SEQUENCES)})")
+        distances = INTERVAL_SEQUENCES[distances](max_distance)
+    distances = sorted({int(d) for d in distances})
+    if not distances or distances[0] < 1:
+        raise ValueError("Interval distances must be positive integers")
+    weights = {int(d): float(weight) for d, weight in (weights or {}).items()}
+    unweighted = set(weights) - set(distances)
+    if unweighted:
+        raise ValueError(f"Weights given for distances {sorted(unweighted)} that the configuration does not use")
+    return {'distances': distances, 'weights': weights}
+
+
+def parse_interval_spec(spec, max_distance=200):
+    # "name=fibonacci", "name=lucas" or "name=2,5,9", optionally followed by "@2=1.5,89=0.5"
+    name, _, definition = spec.partition('=')
+    definition, _, weight_spec = definition.partition('@')
+    if not name or not definition:
+        raise ValueError(f"Interval spec {spec!r} should look like name=fibonacci or name=2,5,9@2=1.5")
+    distances = definition if definition in INTERVAL_SEQUENCES else [int(d) for d in definition.split(',')]
+    weights = {}
+    for item in filter(None, weight_spec.split(',')):
+        distance, _, weight = item.partition('=')
+        weights[int(distance)] = float(weight)
+    return name, interval_config(distances, weights, max_distance)
+
+
+def training_distances(interval_configs=None, max_distance=200):
+    # every distance any configuration needs, counted once and shared between them
+    if not interval_configs:
+        return fibonacci_sequence_unique_no_pos1(max_distance)
+    return sorted(set().union(*(config['distances'] for config in interval_configs.values())))
+
+
+def resolve_intervals(word_models, intervals):
+    # None keeps the original Fibonacci behaviour; a name is looked up in the model's
+    # trained configurations, then in INTERVAL_SEQUENCES; a list is a custom distance set
+    if intervals is None or isinstance(intervals, dict):
+        return intervals
+    trained = getattr(word_models, 'fib_distances', None)
+    if isinstance(intervals, str):
+        configs = getattr(word_models, 'interval_configs', None) or {}
+        if intervals in configs:
+            config = configs[intervals]
+        else:
+            config = interval_config(intervals, max_distance=max(trained) if trained else 200)
+    else:
+        config = interval_config(intervals)
+    if trained is not None:
+        missing = set(config['distances']) - set(trained)
+        if missing:
+            raise ValueError(f"The model has no counts for distances {sorted(missing)}")
+    return config
+
+
+def interval_distances(intervals, span):
+    if intervals is None:
+        return fibonacci_sequence_unique_no_pos1(span)
+    return [d for d in intervals['distances'] if d <= span]
+
+
+def weight_candidate(candidate, intervals, fib_dist):
+    weight = intervals['weights'].get(fib_dist, 1.0) if intervals else 1.0
+    if weight == 1.0:
+        return candidate
+    word, forward_prob, backward_prob, combined_score = candidate
+    return (word, forward_prob, backward_prob, combined_score * weight)
+
+
+@timed('train')
+def create_fibonacci_bidirectional_word_model(words, max_distance=200, engine='python', shared=False, workers=1,
+                                              intervals=None):
+    # intervals: {name: interval_config(...)}; the union of their distances is counted in one pass
+    if engine == 'numpy' or workers > 1:
+        return create_fibonacci_bidirectional_word_model_numpy(
+            words, max_distance, shared=shared, workers=workers, intervals=intervals
+        )
+    if engine != 'python':
+        raise ValueError(f"Unknown training engine: {engine!r} (expected 'python' or 'numpy')")
+    
+    return create_fibonacci_bidirectional_documents_model([words], max_distance, shared=shared, intervals=intervals)
+
+
+@timed('train.python')
+def create_fibonacci_bidirectional_documents_model(documents, max_distance=200, shared=False, intervals=None):
+    # python engine over word lists counted one by one; pairs never cross from one list into the next
+    documents = [words if isinstance(words, list) else list(words) for words in documents]
+    total_words = sum(len(words) for words in documents)
+    print(f"📊 Building bidirectional WORD model from {total_words} words...")
+    get_instrumentation().count('train.tokens', total_words)
     
     forward_model = {}
     backward_model = {}
-    fib_distances = fibonacci_sequence_unique_no_pos1(max_distance)
+    fib_distances = training_distances(intervals, max_distance)
     
     print("🔮 Building forward word predictions...")
-    for pos in range(len(words)):
-        current_word = words[pos]
-        
-        for fib_distance in fib_distances:
-            future_pos = pos + fib_distance
-            if future_pos < len(words):
-                future_word = words[future_pos]
-                
-                if current_word not in forward_model:
-                    forward_model[current_word] = {}
-                if fib_distance not in forward_model[current_word]:
-                    forward_model[current_word][fib_distance] = Counter()
-                
-                forward_model[current_word][fib_distance][future_word] += 1
-        
-        if pos % 50000 == 0:
-            print(f"  Forward: Processed {pos} words...")
+    for words in documents:
+        for pos in range(len(words)):
+            current_word = words[pos]
+            
+            for fib_distance in fib_distances:
+                future_pos = pos + fib_distance
+                if future_pos < len(words):
+                    future_word = words[future_pos]
+                    
+                    if current_word not in forward_model:
+                        forward_model[current_word] = {}
+                    if fib_distance not in forward_model[current_word]:
+                        forward_model[current_word][fib_distance] = Counter()
+                    
+                    forward_model[current_word][fib_distance][future_word] += 1
+            
+            if pos % 50000 == 0:
+                print(f"  Forward: Processed {pos} words...")
     
     print("🔙 Building backward word predictions...")
-    for pos in range(len(words)):
-        current_word = words[pos]
-        
-        for fib_distance in fib_distances:
-            past_pos = pos - fib_distance
-            if past_pos >= 0:
-                past_word = words[past_pos]
-                
-                if current_word not in backward_model:
-                    backward_model[current_word] = {}
-                if fib_distance not in backward_model[current_word]:
-                    backward_model[current_word][fib_distance] = Counter()
-                
-                backward_model[current_word][fib_distance][past_word] += 1
-        
-        if pos % 50000 == 0:
-            print(f"  Backward: Processed {pos} words...")
+    for words in documents:
+        for pos in range(len(words)):
+            current_word = words[pos]
+            
+            for fib_distance in fib_distances:
+                past_pos = pos - fib_distance
+                if past_pos >= 0:
+                    past_word = words[past_pos]
+                    
+                    if current_word not in backward_model:
+                        backward_model[current_word] = {}
+                    if fib_distance not in backward_model[current_word]:
+                        backward_model[current_word][fib_distance] = Counter()
+                    
+                    backward_model[current_word][fib_distance][past_word] += 1
+            
+            if pos % 50000 == 0:
+                print(f"  Backward: Processed {pos} words...")
     
     print(f"✅ Forward word model: {len(forward_model)} unique words")
     print(f"✅ Backward word model: {len(backward_model)} unique words")
     
+    word_models = {'forward': forward_model, 'backward': backward_model}
+    if shared:
+        word_models = SharedWordModel.from_word_models(word_models)
+        word_models.interval_configs = intervals or {}
+    return word_models
+
+
+PAIR_CODE_SHIFT = 32
+PAIR_CODE_MASK = (1 << PAIR_CODE_SHIFT) - 1
+PAIR_ENTRY_BYTES = 16
+
+
+@timed('train.encode')
+def encode_words(words, vocab=None):
+    if vocab is None:
+        vocab = {}
+    if not isinstance(words, (list, tuple)):
+        words = list(words)
+    # new words get ids in order of first occurrence; dict.fromkeys finds them at C speed
+    for word in dict.fromkeys(words):
+        if word not in vocab:
+            vocab[word] = len(vocab)
+    ids = np.fromiter(map(vocab.__getitem__, words), dtype=np.int64, count=len(words))
+    return ids, vocab
+
+
+def first_occurrence_order(values):
+    unique, first = np.unique(values, return_index=True)
+    return unique[np.argsort(first, kind='stable')]
+
+
+def count_fibonacci_pairs(ids, fib_distances, n_left=None):
+    # (left_id << 32 | right_id) codes per distance, kept in order of first occurrence;
+    # n_left restricts pairs to those starting in ids[:n_left]
+    pair_counts = {}
+    for fib_distance in fib_distances:
+        n_pairs = len(ids) - fib_distance
+        if n_left is not None:
+            n_pairs = min(n_pairs, n_left)
+        if n_pairs <= 0:
+            continue
+        codes = (ids[:n_pairs] << PAIR_CODE_SHIFT) | ids[fib_distance:fib_distance + n_pairs]
+        pair_counts[fib_distance] = _sum_codes_in_first_order(codes, np.ones(n_pairs, dtype=np.int64))
+    return pair_counts
+
+
+def _sum_codes_in_first_order(codes, counts):
+    if not len(codes):
+        return codes, counts
+    n_codes = len(codes)
+    left = codes >> PAIR_CODE_SHIFT
+    right = codes & PAIR_CODE_MASK
+    width = int(max(left.max(), right.max())) + 1
+    if width * width * n_codes < 1 << 62:
+        # with the pair packed as left * width + right there is room for each code's position
+        # below it, and sorting those keys (far cheaper than an argsort) keeps equal codes
+        # together in corpus order
+        keys = (left * width + right) * n_codes + np.arange(n_codes)
+        keys.sort()
+        perm = keys % n_codes
+        keys //= n_codes
+    else:
+        perm = np.argsort(codes)
+        keys = codes[perm]
+    is_start = np.empty(n_codes, dtype=bool)
+    is_start[0] = True
+    np.not_equal(keys[1:], keys[:-1], out=is_start[1:])
+    starts = np.flatnonzero(is_start)
+    first = np.minimum.reduceat(perm, starts)
+    # scattering each sum to its code's first position and reading those positions back in
+    # corpus order gives first-occurrence order without a second sort
+    summed = np.zeros(n_codes, dtype=counts.dtype)
+    summed[first] = np.add.reduceat(counts[perm], starts)
+    is_first = np.zeros(n_codes, dtype=bool)
+    is_first[first] = True
+    return codes[is_first], summed[is_first]
+
+
+def merge_pair_counts(pair_count_list):
+    # Tables must be given in corpus order so first-occurrence order survives the merge.
+    merged = {}
+    fib_distances = sorted({d for pair_counts in pair_count_list for d in pair_counts})
+    for fib_distance in fib_distances:
+        tables = [pair_counts[fib_distance] for pair_counts in pair_count_list if fib_distance in pair_counts]
+        codes = np.concatenate([codes for codes, _ in tables])
+        counts = np.concatenate([counts for _, counts in tables])
+        merged[fib_distance] = _sum_codes_in_first_order(codes, counts)
+    return merged
+
+
+def _count_shard_pairs(shard):
+    ids, n_left, fib_distances = shard
+    return count_fibonacci_pairs(ids, fib_distances, n_left)
+
+
+def _count_shards(shards, workers):
+    # yields per-shard pair counts in input order, with at most 2 * workers shards in flight
+    if workers <= 1:
+        for shard in shards:
+            yield _count_shard_pairs(shard)
+        return
+    
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        pending = deque()
+        for shard in shards:
+            pending.append(pool.submit(_count_shard_pairs, shard))
+            if len(pending) >= 2 * workers:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+@timed('train.count_pairs')
+def count_fibonacci_pairs_parallel(ids, fib_distances, workers, shards_per_worker=4):
+    if workers <= 1 or not fib_distances:
+        return count_fibonacci_pairs(ids, fib_distances)
+    
+    # Each shard carries max(fib_distances) extra tokens so pairs that cross into the
+    # next shard are counted once, by the shard their left word belongs to.
+    overlap = max(fib_distances)
+    shard_size = max(-(-len(ids) // (workers * shards_per_worker)), overlap)
+    shards = [
+        (ids[start:start + shard_size + overlap], shard_size, fib_distances)
+        for start in range(0, len(ids), shard_size)
+    ]
+    print(f"🧵 Counting {len(shards)} shards on {workers} worker processes...")
+    
+    return merge_pair_counts(list(_count_shards(shards, workers)))
+
+
+def iter_id_blocks(documents, vocab, fib_distances, block_size=1 << 20):
+    # Only block_size + max(fib_distances) encoded tokens are held at once: each block
+    # counts the pairs starting in its first block_size tokens and keeps the rest as lookahead.
+    overlap = max(fib_distances)
+    for words in documents:
+        words = iter(words)
+        pending = np.empty(0, dtype=np.int64)
+        while True:
+            batch = list(islice(words, block_size))
+            if not batch:
+                break
+            ids, _ = encode_words(batch, vocab)
+            pending = np.concatenate((pending, ids))
+            while len(pending) >= block_size + overlap:
+                yield pending[:block_size + overlap], block_size, fib_distances
+                pending = pending[block_size:]
+        if len(pending):
+            yield pending, len(pending), fib_distances
+
+
+@timed('train.stream_count')
+def count_corpus_pairs(sources, fib_distances, vocab=None, block_size=1 << 20, workers=1):
+    if vocab is None:
+        vocab = {}
+    pair_counts = {}
+    if not fib_distances:
+        return pair_counts, vocab
+    
+    # Block tables are merged once they add up to the size of the running total, so each
+    # pair is re-sorted O(log blocks) times and pending tables never outgrow the total.
+    inst = get_instrumentation()
+    blocks = iter_id_blocks(iter_corpus_documents(sources), vocab, fib_distances, block_size)
+    pending = []
+    pending_size = 0
+    merged_size = 0
+    for block_number, block_counts in enumerate(_count_shards(blocks, workers), 1):
+        inst.count('train.blocks')
+        pending.append(block_counts)
+        pending_size += sum(len(codes) for codes, _ in block_counts.values())
+        if pending_size >= merged_size:
+            pair_counts = merge_pair_counts([pair_counts] + pending)
+            merged_size = sum(len(codes) for codes, _ in pair_counts.values())
+            pending = []
+            pending_size = 0
+            print(f"  Streaming: merged {block_number} blocks ({len(vocab)} unique words so far)...")
+            inst.event('train.stream_merge', blocks=block_number, vocab=len(vocab), unique_pairs=merged_size)
+    if pending:
+        pair_counts = merge_pair_counts([pair_counts] + pending)
+    return pair_counts, vocab
+
+
+def _add_row_totals(row_totals, block_counts, vocab_size):
+    for fib_distance, (codes, counts) in block_counts.items():
+        forward, backward = row_totals.get(fib_distance, (np.zeros(0, dtype=np.int64),) * 2)
+        forward = np.pad(forward, (0, vocab_size - len(forward)))
+        backward = np.pad(backward, (0, vocab_size - len(backward)))
+        forward += np.bincount(codes >> PAIR_CODE_SHIFT, counts, vocab_size).astype(np.int64)
+        backward += np.bincount(codes & PAIR_CODE_MASK, counts, vocab_size).astype(np.int64)
+        row_totals[fib_distance] = (forward, backward)
+
+
+def _prune_pair_counts(pair_counts, max_entries):
+    # Drops every pair whose count is at or below the smallest threshold that leaves at
+    # most max_entries pairs; returns the pruned tables and that threshold.
+    all_counts = np.concatenate([counts for _, counts in pair_counts.values()])
+    if len(all_counts) <= max_entries:
+        return pair_counts, 0
+    threshold = int(np.partition(all_counts, len(all_counts) - max_entries - 1)[len(all_counts) - max_entries - 1])
+    pruned = {}
+    for fib_distance, (codes, counts) in pair_counts.items():
+        keep = counts > threshold
+        if keep.any():
+            pruned[fib_distance] = (codes[keep], counts[keep])
+    return pruned, threshold
+
+
+@timed('train.bounded_count')
+def count_corpus_pairs_bounded(sources, fib_distances, memory_budget, vocab=None, block_size=1 << 20, workers=1):
+    # Lossy counting under a memory budget (bytes) for the pair tables. Whenever the merged
+    # tables outgrow the budget, pairs with counts at or below a threshold t are dropped so
+    # half the budget is left; error_bound is the sum of every t applied. Each kept count is
+    # then at most error_bound below the true count, and every pair seen more than error_bound
+    # times is kept; pairs dropped and seen again restart from zero. Row totals are counted
+    # exactly on the side, since they grow only with the vocabulary. The mutual score often
+    # ranks rare pairs first, and those are what pruning drops: in check-budget runs on 0.4-9 MB
+    # corpora, once pruning started the best candidate changed in 72-97% of rows and 11-28%
+    # of generated positions changed. check-budget measures both for a given corpus and budget.
+    if vocab is None:
+        vocab = {}
+    stats = {'error_bound': 0, 'prunes': 0, 'pruned_pairs': 0}
+    pair_counts, row_totals = {}, {}
+    if not fib_distances:
+        return pair_counts, vocab, row_totals, stats
+    
+    max_entries = memory_budget // PAIR_ENTRY_BYTES
+    # a single block must fit in what is left after pruning
+    block_size = max(1, min(block_size, max_entries // (4 * len(fib_distances))))
+    inst = get_instrumentation()
+    blocks = iter_id_blocks(iter_corpus_documents(sources), vocab, fib_distances, block_size)
+    pending = []
+    pending_size = 0
+    merged_size = 0
+    for block_number, block_counts in enumerate(_count_shards(blocks, workers), 1):
+        inst.count('train.blocks')
+        _add_row_totals(row_totals, block_counts, len(vocab))
+        pending.append(block_counts)
+        pending_size += sum(len(codes) for codes, _ in block_counts.values())
+        if pending_size >= merged_size or merged_size + pending_size > max_entries:
+            pair_counts = merge_pair_counts([pair_counts] + pending)
+            merged_size = sum(len(codes) for codes, _ in pair_counts.values())
+            pending = []
+            pending_size = 0
+            if merged_size > max_entries:
+                pair_counts, threshold = _prune_pair_counts(pair_counts, max_entries // 2)
+                pruned_size = sum(len(codes) for codes, _ in pair_counts.values())
+                stats['error_bound'] += threshold
+                stats['prunes'] += 1
+                stats['pruned_pairs'] += merged_size - pruned_size
+                merged_size = pruned_size
+                print(f"  Bounded: pruned pairs seen {threshold} times or fewer after {block_number} blocks "
+                      f"(error bound now {stats['error_bound']})...")
+                inst.event('train.prune', blocks=block_number, threshold=threshold,
+                           error_bound=stats['error_bound'], unique_pairs=merged_size)
+    if pending:
+        pair_counts = merge_pair_counts([pair_counts] + pending)
+        merged_size = sum(len(codes) for codes, _ in pair_counts.values())
+        if merged_size > max_entries:
+            pair_counts, threshold = _prune_pair_counts(pair_counts, max_entries)
+            stats['error_bound'] += threshold
+            stats['prunes'] += 1
+            stats['pruned_pairs'] += merged_size - sum(len(codes) for codes, _ in pair_counts.values())
+    
+    vocab_size = len(vocab)
+    row_totals = {
+        fib_distance: (np.pad(forward, (0, vocab_size - len(forward))), np.pad(backward, (0, vocab_size - len(backward))))
+        for fib_distance, (forward, backward) in row_totals.items()
+    }
+    return pair_counts, vocab, row_totals, stats
+
+
+def _group_rows(keys):
+    order = stable_group_order(keys)
+    keys = keys[order]
+    starts = np.flatnonzero(np.r_[True, keys[1:] != keys[:-1]])
+    return order, keys[starts], starts
+
+
+def _fill_count_rows(model, fib_distance, word_array, keys, partners, counts):
+    order, row_keys, starts = _group_rows(keys)
+    bounds = np.r_[starts, len(keys)].tolist()
+    row_words = word_array[row_keys].tolist()
+    partner_words = word_array[partners[order]].tolist()
+    row_counts = counts[order].tolist()
+    # Counter.__init__ costs more than filling a typical row, and an empty Counter needs
+    # none of it, so rows are created bare and filled with one dict.update each
+    new_row = Counter.__new__
+    
+    for word, start, end in zip(row_words, bounds, bounds[1:]):
+        row = new_row(Counter)
+        dict.update(row, zip(partner_words[start:end], row_counts[start:end]))
+        model[word][fib_distance] = row
+
+
+@contextmanager
+def _collector_paused():
+    # filling rows allocates millions of containers, each batch of which would start a
+    # cyclic collection; the rows can't form cycles, so nothing is lost by pausing it
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        if enabled:
+            gc.enable()
+
+
+def _empty_rows_in_training_order(word_array, pair_counts):
+    # Every word with a pair at some distance also has one at the smallest distance,
+    # so that table fixes the same word order the pure Python loops produce.
+    forward_words = []
+    backward_words = []
+    if pair_counts:
+        codes, _ = pair_counts[min(pair_counts)]
+        forward_words = word_array[first_occurrence_order(codes >> PAIR_CODE_SHIFT)].tolist()
+        backward_words = word_array[first_occurrence_order(codes & PAIR_CODE_MASK)].tolist()
+    return forward_words, backward_words
+
+
+@timed('train.build_model')
+def pair_counts_to_word_models(vocab_words, pair_counts):
+    word_array = np.array(vocab_words, dtype=object)
+    forward_words, backward_words = _empty_rows_in_training_order(word_array, pair_counts)
+    forward_model = {word: {} for word in forward_words}
+    backward_model = {word: {} for word in backward_words}
+    
+    with _collector_paused():
+        for fib_distance in sorted(pair_counts):
+            codes, counts = pair_counts[fib_distance]
+            left = codes >> PAIR_CODE_SHIFT
+            right = codes & PAIR_CODE_MASK
+            _fill_count_rows(forward_model, fib_distance, word_array, left, right, counts)
+            _fill_count_rows(backward_model, fib_distance, word_array, right, left, counts)
+    
     return {'forward': forward_model, 'backward': backward_model}
 
 
-def generate_fibonacci_bidirectional_words(word_models, start_word, start_pos, max_pos):
-    fib_distances = fibonacci_sequence_unique_no_pos1(max_pos - start_pos)
+@timed('train.build_model')
+def pair_counts_to_shared_word_model(vocab_words, pair_counts):
+    word_array = np.array(vocab_words, dtype=object)
+    forward_words, backward_words = _empty_rows_in_training_order(word_array, pair_counts)
+    forward_model = {word: {} for word in forward_words}
+    vocab = {word: word_id for word_id, word in enumerate(vocab_words)}
+    transposed = {}
+    totals = {}
+    
+    with _collector_paused():
+        for fib_distance in sorted(pair_counts):
+            codes, counts = pair_counts[fib_distance]
+            left = codes >> PAIR_CODE_SHIFT
+            right = codes & PAIR_CODE_MASK
+            _fill_count_rows(forward_model, fib_distance, word_array, left, right, counts)
+            indptr = np.zeros(len(vocab_words) + 1, dtype=np.int64)
+            np.cumsum(np.bincount(right, minlength=len(vocab_words)), out=indptr[1:])
+            transposed[fib_distance] = (indptr, left[stable_group_order(right)])
+            totals[fib_distance] = (np.bincount(left, counts, len(vocab_words)).astype(np.int64),
+                                    np.bincount(right, counts, len(vocab_words)).astype(np.int64))
+    
+    return SharedWordModel(forward_model, vocab_words, {word: vocab[word] for word in backward_words},
+                           transposed, totals)
+
+
+@timed('train.write_binary')
+def write_pair_counts_binary(path, vocab_words, pair_counts, top_k=None, interval_configs=None, row_totals=None,
+                             pair_codes=False):
+    # row_totals: {distance: (forward, backward)} to store instead of the sums of the pair counts
+    word_array = np.arange(len(vocab_words))
+    forward_words, backward_words = _empty_rows_in_training_order(word_array, pair_counts)
+    distance_arrays = {}
+    for fib_distance in sorted(pair_counts):
+        codes, counts = pair_counts[fib_distance]
+        left = codes >> PAIR_CODE_SHIFT
+        right = codes & PAIR_CODE_MASK
+        distance_arrays[fib_distance] = build_distance_arrays(len(vocab_words), left, right, counts, right, left)
+        if row_totals is not None:
+            forward_totals, backward_totals = row_totals[fib_distance]
+            distance_arrays[fib_distance]['forward_totals'] = forward_totals.astype(np.uint64)
+            distance_arrays[fib_distance]['backward_totals'] = backward_totals.astype(np.uint64)
+    write_word_model_binary(path, vocab_words, forward_words, backward_words, distance_arrays, top_k=top_k,
+                            interval_configs=interval_configs, pair_codes=pair_codes)
+
+
+def create_fibonacci_bidirectional_word_model_numpy(words, max_distance=200, shared=False, workers=1, intervals=None):
+    print(f"📊 Building bidirectional WORD model from {len(words)} words (numpy engine)...")
+    inst = get_instrumentation()
+    
+    fib_distances = training_distances(intervals, max_distance)
+    ids, vocab = encode_words(words)
+    print(f"🔢 Encoded {len(vocab)} unique words")
+    
+    pair_counts = count_fibonacci_pairs_parallel(ids, fib_distances, workers)
+    for fib_distance, (codes, _) in pair_counts.items():
+        print(f"  Distance {fib_distance}: {len(codes)} unique pairs")
+        inst.count('train.unique_pairs', len(codes))
+    inst.count('train.tokens', len(words))
+    
+    if shared:
+        word_models = pair_counts_to_shared_word_model(list(vocab), pair_counts)
+        word_models.interval_configs = intervals or {}
+    else:
+        word_models = pair_counts_to_word_models(list(vocab), pair_counts)
+    
+    print(f"✅ Forward word model: {len(word_models['forward'])} unique words")
+    print(f"✅ Backward word model: {len(word_models['backward'])} unique words")
+    
+    return word_models
+
+
+def ranked_mutual_candidates(word_models, start_word, fib_dist, direction):
+    ranker = getattr(word_models, 'ranked_candidates', None)
+    if ranker is not None:
+        ranked = ranker(start_word, fib_dist, direction)
+        if ranked is not None:
+            return ranked
+    return sorted(score_mutual_candidates(word_models, start_word, fib_dist, direction), key=lambda x: x[3], reverse=True)
+
+
+def top_mutual_candidates(word_models, start_word, fib_dist, direction, top_k):
+    # the first top_k of ranked_mutual_candidates, without sorting the whole row
+    ranker = getattr(word_models, 'ranked_candidates', None)
+    if ranker is not None:
+        ranked = ranker(start_word, fib_dist, direction)
+        if ranked is not None and len(ranked) >= top_k:
+            return ranked[:top_k]
+    candidates = score_mutual_candidates(word_models, start_word, fib_dist, direction)
+    # nlargest keeps equal scores in input order, exactly like the stable sort
+    return heapq.nlargest(top_k, candidates, key=lambda x: x[3])
+
+
+class CandidateSampler:
+    # Draws a candidate instead of taking the best one. Weights are combined_score ** (1 / temperature)
+    # over the best top_k candidates, cut to the smallest prefix holding top_p of the weight. The
+    # cumulative table is built once per (word, distance, direction) and reused for every later
+    # draw, so keep one sampler per word model. temperature=0 is greedy decoding.
+    def __init__(self, temperature=1.0, top_k=None, top_p=None, seed=None):
+        if temperature < 0:
+            raise ValueError("temperature must be >= 0")
+        if top_p is not None and not 0 < top_p <= 1:
+            raise ValueError("top_p must be in (0, 1]")
+        self.temperature = temperature
+        self.top_k = top_k
+        self.top_p = top_p
+        self.rng = random.Random(seed)
+        self.tables = {}
+
+    def table(self, word_models, start_word, fib_dist, direction):
+        key = (start_word, fib_dist, direction)
+        table = self.tables.get(key)
+        if table is None:
+            if self.top_k:
+                candidates = top_mutual_candidates(word_models, start_word, fib_dist, direction, self.top_k)
+            else:
+                candidates = ranked_mutual_candidates(word_models, start_word, fib_dist, direction)
+            if not candidates or self.temperature == 0 or candidates[0][3] <= 0:
+                cumulative = [1.0] if candidates else []
+                candidates = candidates[:1]
+            else:
+                # scaled by the best score first, so low temperatures don't underflow
+                best_score = candidates[0][3]
+                cumulative = list(accumulate((c[3] / best_score) ** (1 / self.temperature) for c in candidates))
+                if self.top_p is not None and self.top_p < 1:
+                    cut = bisect_left(cumulative, self.top_p * cumulative[-1]) + 1
+                    candidates, cumulative = candidates[:cut], cumulative[:cut]
+            table = self.tables[key] = (candidates, cumulative)
+        return table
+
+    def draw(self, word_models, start_word, fib_dist, direction):
+        candidates, cumulative = self.table(word_models, start_word, fib_dist, direction)
+        if not candidates:
+            return None
+        if len(candidates) == 1:
+            return candidates[0]
+        return candidates[bisect_right(cumulative, self.rng.random() * cumulative[-1])]
+
+
+def sample_mutual_candidates(word_models, requests, sampler=None):
+    # best_mutual_candidates, or one draw per request when a sampler is given
+    if sampler is None:
+        return best_mutual_candidates(word_models, requests)
+    return [sampler.draw(word_models, *request) for request in requests]
+
+
+@timed('generate.bidirectional')
+def generate_fibonacci_bidirectional_words(word_models, start_word, start_pos, max_pos, analysis=True, top_k=None,
+                                           intervals=None, sampler=None):
+    # analysis=False returns (winners, None) without building any candidate lists;
+    # top_k keeps only each position's best top_k candidates in the analysis;
+    # a CandidateSampler draws each position's word instead of taking the best
+    intervals = resolve_intervals(word_models, intervals)
+    if not analysis:
+        targets = list(_seed_targets(start_pos, max_pos, intervals))
+        best = sample_mutual_candidates(
+            word_models, [(start_word, fib_dist, direction) for fib_dist, direction, _ in targets], sampler
+        )
+        get_instrumentation().count('lookups', len(targets))
+        return {
+            target_pos: weight_candidate(candidate, intervals, fib_dist)
+            for (fib_dist, _, target_pos), candidate in zip(targets, best) if candidate is not None
+        }, None
+    
+    fib_distances = interval_distances(intervals, max_pos - start_pos)
     generated = {}
     analysis_data = {}
-    
-    forward_model = word_models['forward']
-    backward_model = word_models['backward']
+    lookups = 0
     
     for fib_dist in fib_distances:
-        target_pos = start_pos + fib_dist
-        if target_pos <= max_pos:
-            forward_candidates = {}
-            if start_word in forward_model and fib_dist in forward_model[start_word]:
-                counts = forward_model[start_word][fib_dist]
-                total = sum(counts.values())
-                for word, count in counts.items():
-                    forward_candidates[word] = count / total
-            
-            valid_candidates = {}
-            for candidate_word, forward_prob in forward_candidates.items():
-                backward_prob = 0.0
-                if candidate_word in backward_model and fib_dist in backward_model[candidate_word]:
-                    back_counts = backward_model[candidate_word][fib_dist]
-                    back_total = sum(back_counts.values())
-                    if start_word in back_counts:
-                        backward_prob = back_counts[start_word] / back_total
-                
-                if backward_prob > 0:
-                    combined_score = forward_prob * backward_prob
-                    valid_candidates[candidate_word] = (forward_prob, backward_prob, combined_score)
+        for direction in (1, -1):
+            target_pos = start_pos + direction * fib_dist
+            if target_pos > max_pos or target_pos < 1:
+                continue
             
-            if valid_candidates:
-                sorted_candidates = sorted(
-                    [(word, forward, backward, combined) for word, (forward, backward, combined) in valid_candidates.items()],
-                    key=lambda x: x[3], reverse=True
-                )
-                
-                analysis_data[target_pos] = {
-                    'all_candidates': sorted_candidates,
-                    'from_seed': start_word,
-                    'fib_distance': fib_dist
-                }
-                
-                best_word = sorted_candidates[0][0]
-                forward_prob, backward_prob, combined_score = sorted_candidates[0][1:]
-                generated[target_pos] = (best_word, forward_prob, backward_prob, combined_score)
-        
-        target_pos = start_pos - fib_dist
-        if target_pos >= 1:
-            backward_candidates = {}
-            if start_word in backward_model and fib_dist in backward_model[start_word]:
-                counts = backward_model[start_word][fib_dist]
-                total = sum(counts.values())
-                for word, count in counts.items():
-                    backward_candidates[word] = count / total
-            
-            valid_candidates = {}
-            for candidate_word, backward_prob in backward_candidates.items():
-                forward_prob = 0.0
-                if candidate_word in forward_model and fib_dist in forward_model[candidate_word]:
-                    forward_counts = forward_model[candidate_word][fib_dist]
-                    forward_total = sum(forward_counts.values())
-                    if start_word in forward_counts:
-                        forward_prob = forward_counts[start_word] / forward_total
-                
-                if forward_prob > 0:
-                    combined_score = forward_prob * backward_prob
-                    valid_candidates[candidate_word] = (forward_prob, backward_prob, combined_score)
-            
-            if valid_candidates:
-                sorted_candidates = sorted(
-                    [(word, forward, backward, combined) for word, (forward, backward, combined) in valid_candidates.items()],
-                    key=lambda x: x[3], reverse=True
-                )
-                
+            lookups += 1
+            if top_k:
+                sorted_candidates = top_mutual_candidates(word_models, start_word, fib_dist, direction, top_k)
+            else:
+                sorted_candidates = ranked_mutual_candidates(word_models, start_word, fib_dist, direction)
+            if intervals and intervals['weights'].get(fib_dist, 1.0) != 1.0:
+                sorted_candidates = [weight_candidate(c, intervals, fib_dist) for c in sorted_candidates]
+            if sorted_candidates:
+
                 analysis_data[target_pos] = {
                     'all_candidates': sorted_candidates,
                     'from_seed': start_word,
-                    'fib_distance': -fib_dist
+                    'fib_distance': direction * fib_dist
                 }
                 
-                best_word = sorted_candidates[0][0]
-                forward_prob, backward_prob, combined_score = sorted_candidates[0][1:]
-                generated[target_pos] = (best_word, forward_prob, backward_prob, combined_score)
+                if sampler is None:
+                    generated[target_pos] = sorted_candidates[0]
+                else:
+                    generated[target_pos] = weight_candidate(
+                        sampler.draw(word_models, start_word, fib_dist, direction), intervals, fib_dist
+                    )
     
+    inst = get_instrumentation()
+    if inst.enabled:
+        inst.count('lookups', lookups)
+        inst.count('candidates_scored', sum(len(data['all_candidates']) for data in analysis_data.values()))
     return generated, analysis_data
 
 
+@lru_cache(maxsize=1 << 16)
+def cached_syllable_split(word):
+    return tuple(best_syllable_split(word))
+
+
 def syllable_word_similarity(syllable, word):
-    word_syllables = best_syllable_split(word)
+    word_syllables = cached_syllable_split(word)
     
     if syllable in word_syllables:
         return 1.0
@@ -181,24 +821,32 @@ def syllable_word_similarity(syllable, word):
     return 0.0
 
 
-def generate_fibonacci_bidirectional_multi_words(word_models, seed_words, length=20, verbose=True):
+@timed('generate.multi')
+def generate_fibonacci_bidirectional_multi_words(word_models, seed_words, length=20, verbose=True,
+                                                  analysis=True, top_k=None, intervals=None, sampler=None):
     if verbose:
         print(f"🔄 Bidirectional multi-calc word generation: {length} positions")
         print(f"🌱 Full word seed: {seed_words}")
+    inst = get_instrumentation()
+    tracing = inst.tracing
+    replacements = 0
+    fills = 0
+    intervals = resolve_intervals(word_models, intervals)
     
     sequence = {}
-    all_analysis_data = {}
+    all_analysis_data = {} if analysis else None
     max_pos = length
     
     for i, word in enumerate(seed_words):
         pos = i + 1
         if pos <= max_pos:
             sequence[pos] = (word, 1.0, 1.0, 1.0)
-            all_analysis_data[pos] = {
-                'all_candidates': [(word, 1.0, 1.0, 1.0)],
-                'from_seed': 'SEED',
-                'fib_distance': 0
-            }
+            if analysis:
+                all_analysis_data[pos] = {
+                    'all_candidates': [(word, 1.0, 1.0, 1.0)],
+                    'from_seed': 'SEED',
+                    'fib_distance': 0
+                }
             if verbose:
                 print(f"🌱 Seed pos {pos}: '{word}'")
     
@@ -207,9 +855,12 @@ def generate_fibonacci_bidirectional_multi_words(word_models, seed_words, length
         if start_pos <= max_pos:
             if verbose:
                 print(f"\n🔄 Bidirectional word gen from position {start_pos} ('{seed_word}'):")
-            gen, analysis_data = generate_fibonacci_bidirectional_words(word_models, seed_word, start_pos, max_pos)
+            gen, analysis_data = generate_fibonacci_bidirectional_words(
+                word_models, seed_word, start_pos, max_pos, analysis=analysis, top_k=top_k, intervals=intervals,
+                sampler=sampler
+            )
             
-            for pos, data in analysis_data.items():
+            for pos, data in (analysis_data or {}).items():
                 if pos not in all_analysis_data:
                     all_analysis_data[pos] = {'competing_options': []}
                 if 'competing_options' not in all_analysis_data[pos]:
@@ -226,6 +877,9 @@ def generate_fibonacci_bidirectional_multi_words(word_models, seed_words, length
                     elif combined_score > existing_score:
                         if verbose:
                             print(f"  Pos {pos}: '{word}' (F:{forward_prob:.1%} B:{backward_prob:.1%} C:{combined_score:.3f}) [REPLACES '{existing_word}' (C:{existing_score:.3f})")
+                        if tracing:
+                            inst.event('multi.replace', pos=pos, word=word, score=combined_score, previous=existing_word)
+                        replacements += 1
                         sequence[pos] = (word, forward_prob, backward_prob, combined_score)
                     else:
                         if verbose:
@@ -233,6 +887,9 @@ def generate_fibonacci_bidirectional_multi_words(word_models, seed_words, length
                 else:
                     if verbose:
                         print(f"  Pos {pos}: '{word}' (F:{forward_prob:.1%} B:{backward_prob:.1%} C:{combined_score:.3f}) [FILLS GAP]")
+                    if tracing:
+                        inst.event('multi.fill', pos=pos, word=word, score=combined_score)
+                    fills += 1
                     sequence[pos] = (word, forward_prob, backward_prob, combined_score)
     
     result = []
@@ -253,24 +910,225 @@ def generate_fibonacci_bidirectional_multi_words(word_models, seed_words, length
         final_filled = [w for w in result if w != "_"]
         print(f"Final filled words: {' '.join(final_filled)}")
     
+    if inst.enabled:
+        inst.count('replacements', replacements)
+        inst.count('fills', fills)
     return result, all_analysis_data
 
 
-def generate_fibonacci_diffusion_words(word_models, seed_words, length=20, diffusion_steps=3, verbose=True):
+def best_mutual_candidates(word_models, requests):
+    batch = getattr(word_models, 'best_mutual_candidates', None)
+    if batch is not None:
+        return batch(requests)
+    
+    best = []
+    for start_word, fib_dist, direction in requests:
+        if getattr(word_models, 'ranked_candidates', None) is not None:
+            candidates = ranked_mutual_candidates(word_models, start_word, fib_dist, direction)
+        else:
+            candidates = score_mutual_candidates(word_models, start_word, fib_dist, direction)
+        # max() keeps the first of equal scores, as the stable descending sort does
+        best.append(max(candidates, key=lambda x: x[3]) if candidates else None)
+    return best
+
+
+def _seed_targets(start_pos, max_pos, intervals=None):
+    for fib_dist in interval_distances(intervals, max_pos - start_pos):
+        for direction in (1, -1):
+            target_pos = start_pos + direction * fib_dist
+            if 1 <= target_pos <= max_pos:
+                yield fib_dist, direction, target_pos
+
+
+@timed('generate.multi_batch')
+def generate_fibonacci_bidirectional_multi_words_batch(word_models, seed_word_lists, length=20, intervals=None,
+                                                        sampler=None):
+    # Same sequences as generate_fibonacci_bidirectional_multi_words(..., verbose=False)[0]
+    # for each prompt; each distinct (seed word, distance, direction) is looked up once.
+    # A sampler shares only its cumulative tables across the batch and draws separately for
+    # every (prompt, seed position, target), in the order a loop over the prompts would.
+    intervals = resolve_intervals(word_models, intervals)
+    best = None
+    if sampler is None:
+        requests = {}
+        for seed_words in seed_word_lists:
+            for i, seed_word in enumerate(seed_words[:length]):
+                for fib_dist, direction, _ in _seed_targets(i + 1, length, intervals):
+                    requests.setdefault((seed_word, fib_dist, direction), None)
+        best = dict(zip(requests, best_mutual_candidates(word_models, list(requests))))
+        get_instrumentation().count('lookups', len(requests))
+    
+    results = []
+    for seed_words in seed_word_lists:
+        sequence = {i + 1: (word, 1.0, 1.0, 1.0) for i, word in enumerate(seed_words[:length])}
+        for i, seed_word in enumerate(seed_words[:length]):
+            gen = {}
+            for fib_dist, direction, target_pos in _seed_targets(i + 1, length, intervals):
+                if best is None:
+                    candidate = sampler.draw(word_models, seed_word, fib_dist, direction)
+                else:
+                    candidate = best[(seed_word, fib_dist, direction)]
+                if candidate is not None:
+                    gen[target_pos] = weight_candidate(candidate, intervals, fib_dist)
+            
+            for pos in sorted(gen):
+                combined_score = gen[pos][3]
+                if pos in sequence:
+                    existing_score = sequence[pos][3]
+                    if existing_score != 1.0 and combined_score > existing_score:
+                        sequence[pos] = gen[pos]
+                else:
+                    sequence[pos] = gen[pos]
+        
+        results.append([sequence[pos][0] if pos in sequence else "_" for pos in range(1, length + 1)])
+    return results
+
+
+def document_words(document):
+    # documents are raw text or already tokenised word lists
+    if isinstance(document, str):
+        return WORD_PATTERN.findall(document.lower())
+    return list(document)
+
+
+@timed('score')
+def score_documents(word_models, documents, intervals=None, token_scores=False):
+    # Fibonacci coherence of a batch of documents in one vectorised pass. A token's support is
+    # the mean mutual score (forward_prob * backward_prob, as in generation) of its pairs with the
+    # tokens at each interval distance before and after it, unseen pairs scoring 0; a document
+    # scores the mean support of its tokens. Pass a PairScoreIndex to skip the lookup build.
+    index = pair_score_index(word_models)
+    intervals = resolve_intervals(index, intervals)
+    token_lists = [document_words(document) for document in documents]
+    lengths = np.array([len(tokens) for tokens in token_lists], dtype=np.int64)
+    ids = index.encode([word for tokens in token_lists for word in tokens])
+    doc_ids = np.repeat(np.arange(len(token_lists)), lengths)
+    
+    support = np.zeros(len(ids), dtype=np.float64)
+    pair_counts = np.zeros(len(ids), dtype=np.int64)
+    for fib_dist in interval_distances(intervals, int(lengths.max(initial=1)) - 1):
+        if fib_dist not in index.tables:
+            continue
+        # pairs (i, i + fib_dist) inside one document add their score to both tokens
+        same_doc = doc_ids[fib_dist:] == doc_ids[:-fib_dist]
+        left = np.flatnonzero(same_doc)
+        scores = np.zeros(len(same_doc), dtype=np.float64)
+        scores[left] = index.pair_scores(fib_dist, ids[left], ids[left + fib_dist])
+        weight = intervals['weights'].get(fib_dist, 1.0) if intervals else 1.0
+        if weight != 1.0:
+            scores *= weight
+        support[:-fib_dist] += scores
+        support[fib_dist:] += scores
+        pair_counts[:-fib_dist] += same_doc
+        pair_counts[fib_dist:] += same_doc
+    
+    support /= np.maximum(pair_counts, 1)
+    doc_scores = np.bincount(doc_ids, weights=support, minlength=len(token_lists)) / np.maximum(lengths, 1)
+    
+    instrumentation = get_instrumentation()
+    instrumentation.count('scored_documents', len(token_lists))
+    instrumentation.count('scored_tokens', len(ids))
+    if not token_scores:
+        return doc_scores, None
+    bounds = np.cumsum(lengths)[:-1]
+    return doc_scores, [
+        list(zip(tokens, values.tolist())) for tokens, values in zip(token_lists, np.split(support, bounds))
+    ]
+
+
+def score_text(word_models, text, intervals=None):
+    doc_scores, token_support = score_documents(word_models, [text], intervals, token_scores=True)
+    return float(doc_scores[0]), token_support[0]
+
+
+def iter_document_lines(paths=()):
+    # one document per line; stdin when no paths are given
+    if not paths:
+        for line in sys.stdin:
+            yield line.rstrip('\n')
+    for path in paths:
+        with open(path, 'r', encoding='utf-8') as f:
+            for line in f:
+                yield line.rstrip('\n')
+
+
+def iter_document_scores(word_models, documents, batch_size=1024, intervals=None):
+    # streams (document, score) over any iterable, scoring batch_size documents at a time
+    index = pair_score_index(word_models)
+    documents = iter(documents)
+    while True:
+        batch = list(islice(documents, batch_size))
+        if not batch:
+            break
+        doc_scores, _ = score_documents(index, batch, intervals)
+        yield from zip(batch, doc_scores.tolist())
+
+
+@timed('related.build')
+def build_related_word_index(word_models, top_m=100, intervals=None):
+    intervals = resolve_intervals(word_models, intervals)
+    if intervals is None:
+        return RelatedWordIndex.build(word_models, top_m)
+    return RelatedWordIndex.build(word_models, top_m, intervals['distances'], intervals['weights'])
+
+
+@timed('related.expand')
+def expand_related_words(related_index, seed_words, n=50, hops=2, beam=25, decay=0.5):
+    # Up to n distinct related words, best first. Each expanded word spreads its weight over its
+    # association list (normalised so its best partner gets the full weight); seeds weigh 1.0,
+    # later hops the `beam` best new words at `decay` times their score. Hopping continues past
+    # `hops` until n words are found or nothing is left to expand.
+    ids = related_index.ids
+    seed_ids = {ids[word] for word in seed_words if word in ids}
+    frontier = [(word_id, 1.0) for word_id in sorted(seed_ids)]
+    expanded = set(seed_ids)
+    totals = {}
+    hop = 0
+    while frontier and (hop < hops or len(totals) < n):
+        for word_id, weight in frontier:
+            partners, scores = related_index.row(word_id)
+            if not len(scores) or scores[0] <= 0:
+                continue
+            for partner, score in zip(partners.tolist(), (scores * (weight / scores[0])).tolist()):
+                if partner not in seed_ids:
+                    totals[partner] = totals.get(partner, 0.0) + score
+        hop += 1
+        ranked = sorted(totals, key=lambda word_id: (-totals[word_id], word_id))
+        frontier = [(word_id, totals[word_id] * decay) for word_id in ranked if word_id not in expanded][:beam]
+        expanded.update(word_id for word_id, _ in frontier)
+    
+    get_instrumentation().count('related.hops', hop)
+    best = sorted(totals, key=lambda word_id: (-totals[word_id], word_id))[:n]
+    return [related_index.words[word_id] for word_id in best]
+
+
+@timed('generate.diffusion')
+def generate_fibonacci_diffusion_words(word_models, seed_words, length=20, diffusion_steps=3, verbose=True,
+                                      analysis=True, intervals=None, sampler=None):
     if verbose:
         print(f"🌊 WORD DIFFUSION GENERATION: {diffusion_steps} steps, {length} positions")
         print(f"🌱 Initial word seed: {seed_words}")
+    inst = get_instrumentation()
+    tracing = inst.tracing
+    intervals = resolve_intervals(word_models, intervals)
     
     current_sequence = {}
-    all_analysis_data = {}
+    all_analysis_data = {} if analysis else None
     
     for i, word in enumerate(seed_words):
         pos = i + 1
         if pos <= length:
             current_sequence[pos] = (word, 1.0, 0)
-            all_analysis_data[pos] = {
-                'step_history': [{'step': 0, 'source': 'SEED', 'candidates': [(word, 1.0, 1.0, 1.0)], 'chosen': word}]
-            }
+            if analysis:
+                all_analysis_data[pos] = {
+                    'step_history': [{'step': 0, 'source': 'SEED', 'candidates': [(word, 1.0, 1.0, 1.0)], 'chosen': word}]
+                }
+    
+    # A source's proposals depend only on its word and position (the weight just scales
+    # them), so they are kept across steps and recomputed only where the word changed;
+    # with a sampler each (word, distance, direction) is drawn once per call
+    source_proposals = {}
+    best = {}
     
     for step in range(diffusion_steps):
         if verbose:
@@ -281,26 +1139,35 @@ def generate_fibonacci_diffusion_words(word_models, seed_words, length=20, diffu
             word, weight, _ = current_sequence[pos]
             starting_points.append((pos, word, weight))
         
+        stale = [(pos, word) for pos, word, _ in starting_points
+                 if pos not in source_proposals or source_proposals[pos][0] != word]
+        requests = {}
+        for start_pos, start_word in stale:
+            for fib_dist, direction, _ in _seed_targets(start_pos, length, intervals):
+                if (start_word, fib_dist, direction) not in best:
+                    requests.setdefault((start_word, fib_dist, direction), None)
+        best.update(zip(requests, sample_mutual_candidates(word_models, list(requests), sampler)))
+        if inst.enabled:
+            inst.count('diffusion_steps')
+            inst.count('lookups', len(requests))
+            inst.count('sources_recomputed', len(stale))
+            inst.count('sources_reused', len(starting_points) - len(stale))
+        for start_pos, start_word in stale:
+            gen = {}
+            for fib_dist, direction, target_pos in _seed_targets(start_pos, length, intervals):
+                candidate = best[(start_word, fib_dist, direction)]
+                if candidate is not None:
+                    gen[target_pos] = weight_candidate(candidate, intervals, fib_dist)
+            source_proposals[start_pos] = (start_word, gen)
+        
         step_proposals = {}
-        step_analysis = {}
+        changed = False
         
         for start_pos, start_word, start_weight in starting_points:
             if verbose:
                 print(f"  🔄 Word gen from pos {start_pos} ('{start_word}', w:{start_weight:.3f})")
             
-            gen, gen_analysis = generate_fibonacci_bidirectional_words(word_models, start_word, start_pos, length)
-            
-            for pos, analysis in gen_analysis.items():
-                if pos not in step_analysis:
-                    step_analysis[pos] = {'source_analyses': []}
-                
-                analysis['source_pos'] = start_pos
-                analysis['source_word'] = start_word
-                analysis['source_weight'] = start_weight
-                analysis['step'] = step + 1
-                step_analysis[pos]['source_analyses'].append(analysis)
-            
-            for pos, (word, forward_prob, backward_prob, combined_score) in gen.items():
+            for pos, (word, forward_prob, backward_prob, combined_score) in source_proposals[start_pos][1].items():
                 weighted_score = combined_score * start_weight
                 
                 if pos not in step_proposals:
@@ -312,20 +1179,21 @@ def generate_fibonacci_diffusion_words(word_models, seed_words, length=20, diffu
             best_proposal = max(proposals, key=lambda x: x[1])
             best_word, best_score, source_pos, source_weight, forward_prob, backward_prob, combined_score = best_proposal
             
-            step_candidates = []
-            for word, w_score, s_pos, s_weight, f_prob, b_prob, c_score in proposals:
-                step_candidates.append((word, f_prob, b_prob, c_score))
-            step_candidates.sort(key=lambda x: x[3], reverse=True)
-            
-            if pos not in all_analysis_data:
-                all_analysis_data[pos] = {'step_history': []}
-            
-            all_analysis_data[pos]['step_history'].append({
-                'step': step + 1,
-                'source': f"pos_{source_pos}",
-                'candidates': step_candidates,
-                'chosen': best_word if pos not in current_sequence or current_sequence[pos][2] != 0 else current_sequence[pos][0]
-            })
+            if analysis:
+                step_candidates = []
+                for word, w_score, s_pos, s_weight, f_prob, b_prob, c_score in proposals:
+                    step_candidates.append((word, f_prob, b_prob, c_score))
+                step_candidates.sort(key=lambda x: x[3], reverse=True)
+                
+                if pos not in all_analysis_data:
+                    all_analysis_data[pos] = {'step_history': []}
+                
+                all_analysis_data[pos]['step_history'].append({
+                    'step': step + 1,
+                    'source': f"pos_{source_pos}",
+                    'candidates': step_candidates,
+                    'chosen': best_word if pos not in current_sequence or current_sequence[pos][2] != 0 else current_sequence[pos][0]
+                })
             
             if pos in current_sequence:
                 existing_word, existing_weight, existing_step = current_sequence[pos]
@@ -336,16 +1204,40 @@ def generate_fibonacci_diffusion_words(word_models, seed_words, length=20, diffu
                 elif best_score > existing_weight:
                     if verbose:
                         print(f"    Pos {pos}: '{best_word}' (w:{best_score:.3f}) REPLACES '{existing_word}' (w:{existing_weight:.3f})")
+                    if tracing:
+                        inst.event('diffusion.replace', step=step + 1, pos=pos, word=best_word,
+                                   score=best_score, previous=existing_word)
+                    inst.count('replacements')
                     current_sequence[pos] = (best_word, best_score, step + 1)
-                    all_analysis_data[pos]['step_history'][-1]['chosen'] = best_word
+                    if analysis:
+                        all_analysis_data[pos]['step_history'][-1]['chosen'] = best_word
+                    changed = True
                 else:
                     if verbose:
                         print(f"    Pos {pos}: keeps '{existing_word}' (w:{existing_weight:.3f}) vs '{best_word}' (w:{best_score:.3f})")
             else:
                 if verbose:
                     print(f"    Pos {pos}: '{best_word}' (w:{best_score:.3f}) FILLS GAP")
+                if tracing:
+                    inst.event('diffusion.fill', step=step + 1, pos=pos, word=best_word, score=best_score)
+                inst.count('fills')
                 current_sequence[pos] = (best_word, best_score, step + 1)
-                all_analysis_data[pos]['step_history'][-1]['chosen'] = best_word
+                if analysis:
+                    all_analysis_data[pos]['step_history'][-1]['chosen'] = best_word
+                changed = True
+        
+        if not changed:
+            # Nothing moved, so every later step would repeat this one exactly
+            if verbose and step + 1 < diffusion_steps:
+                print(f"\n💤 Step {step + 1} changed nothing, repeating it for the remaining steps")
+            if tracing:
+                inst.event('diffusion.converged', step=step + 1, skipped_steps=diffusion_steps - step - 1)
+            for pos in (step_proposals if analysis else ()):
+                history = all_analysis_data[pos]['step_history']
+                entry = history[-1]
+                for later_step in range(step + 2, diffusion_steps + 1):
+                    history.append(dict(entry, step=later_step, candidates=list(entry['candidates'])))
+            break
     
     result = []
     if verbose:
@@ -364,7 +1256,55 @@ def generate_fibonacci_diffusion_words(word_models, seed_words, length=20, diffu
     return result, all_analysis_data
 
 
-def generate_fibonacci_dual_level(syllable_models, word_models, seed_words, length=20):
+def align_syllables_to_words(syllables, words):
+    # Greedy alignment: each syllable takes the first unused word with the highest
+    # syllable_word_similarity, if that is above 0.3. Only the 1.0 (one of the word's
+    # syllables) and 0.7 (substring) tiers can pass, so each tier is an inverted index from
+    # syllable to candidate words in position order, walked past used words with a cursor.
+    candidates = list(dict.fromkeys(word for word in words if word))
+    wanted = set(syllables)
+    wanted.discard('_')
+    lengths = {len(syllable) for syllable in wanted}
+    
+    whole = {}
+    inside = {}
+    for index, word in enumerate(candidates):
+        for syllable in dict.fromkeys(cached_syllable_split(word)):
+            if syllable in wanted:
+                whole.setdefault(syllable, []).append(index)
+        for length in lengths:
+            for part in dict.fromkeys(word[start:start + length] for start in range(len(word) - length + 1)):
+                if part in wanted:
+                    inside.setdefault(part, []).append(index)
+    
+    used = [False] * len(candidates)
+    tiers = ((whole, {}, 1.0), (inside, {}, 0.7))
+    aligned = []
+    syllable_to_word = {}
+    similarities = {}
+    for i, syllable in enumerate(syllables):
+        if syllable == '_':
+            continue
+        for index, cursors, similarity in tiers:
+            entries = index.get(syllable, ())
+            cursor = cursors.get(syllable, 0)
+            while cursor < len(entries) and used[entries[cursor]]:
+                cursor += 1
+            cursors[syllable] = cursor
+            if cursor < len(entries):
+                used[entries[cursor]] = True
+                word = candidates[entries[cursor]]
+                syllable_to_word[i] = word
+                similarities[i] = similarity
+                aligned.append(word)
+                break
+        else:
+            aligned.append(syllable)
+    return aligned, syllable_to_word, similarities
+
+
+@timed('generate.dual_level')
+def generate_fibonacci_dual_level(syllable_models, word_models, seed_words, length=20, verbose=True, intervals=None):
     seed_syllables = []
     for word in seed_words:
         seed_syllables.extend(best_syllable_split(word))
@@ -378,15 +1318,17 @@ def generate_fibonacci_dual_level(syllable_models, word_models, seed_words, leng
     
     effective_length = max(effective_length, 25)
     
-    print(f"🔄 DUAL-LEVEL Fibonacci generation: {effective_length} positions")
-    print(f"🌱 Seed words: {seed_words}")
-    print(f"🌱 Seed syllables: {seed_syllables} ({len(seed_syllables)} syllables)")
-    print(f"🎯 Forcing extension from {len(seed_syllables)} to {effective_length} positions")
-    
-    print("\n📝 Generating syllable sequence...")
+    inst = get_instrumentation()
+    if verbose:
+        print(f"🔄 DUAL-LEVEL Fibonacci generation: {effective_length} positions")
+        print(f"🌱 Seed words: {seed_words}")
+        print(f"🌱 Seed syllables: {seed_syllables} ({len(seed_syllables)} syllables)")
+        print(f"🎯 Forcing extension from {len(seed_syllables)} to {effective_length} positions")
+        print("\n📝 Generating syllable sequence...")
     syllable_result = generate_fibonacci_bidirectional_multi(syllable_models, seed_syllables, effective_length, verbose=False)
     
-    print("\n📖 Generating word sequence...")
+    if verbose:
+        print("\n📖 Generating word sequence...")
     word_sequence = {}
     max_word_pos = effective_length // 2 + len(seed_words)
     
@@ -397,7 +1339,9 @@ def generate_fibonacci_dual_level(syllable_models, word_models, seed_words, leng
     for i, seed_word in enumerate(seed_words):
         start_pos = i + 1
         if start_pos <= max_word_pos:
-            word_gen, _ = generate_fibonacci_bidirectional_words(word_models, seed_word, start_pos, max_word_pos)
+            word_gen, _ = generate_fibonacci_bidirectional_words(
+                word_models, seed_word, start_pos, max_word_pos, analysis=False, intervals=intervals
+            )
             
             for pos in sorted(word_gen.keys()):
                 word, forward_prob, backward_prob, combined_score = word_gen[pos]
@@ -410,8 +1354,8 @@ def generate_fibonacci_dual_level(syllable_models, word_models, seed_words, leng
                 else:
                     word_sequence[pos] = (word, forward_prob, backward_prob, combined_score)
     
-    print("\n🔗 Aligning syllables with words...")
-    final_result = []
+    if verbose:
+        print("\n🔗 Aligning syllables with words...")
     
     word_list = []
     for pos in range(1, max_word_pos + 1):
@@ -423,48 +1367,31 @@ def generate_fibonacci_dual_level(syllable_models, word_models, seed_words, leng
     clean_syllables = [s for s in syllable_result if s != '_']
     clean_words = [w for w in word_list if w]
     
-    syllable_to_word = {}
-    used_words = set()
-    
-    for i, syl in enumerate(syllable_result):
-        if syl != '_':
-            best_word = None
-            best_similarity = 0.0
-            
-            for word in word_list:
-                if word and word not in used_words:
-                    similarity = syllable_word_similarity(syl, word)
-                    if similarity > best_similarity:
-                        best_similarity = similarity
-                        best_word = word
-            
-            if best_word and best_similarity > 0.3:
-                syllable_to_word[i] = best_word
-                used_words.add(best_word)
-                final_result.append(best_word)
-            else:
-                final_result.append(syl)
-    
-    print("\n" + "="*70)
-    print("🎯 DUAL-LEVEL GENERATION RESULTS")
-    print("="*70)
+    final_result, syllable_to_word, similarities = align_syllables_to_words(syllable_result, word_list)
     
-    print(f"\n📝 SYLLABLE VERSION ({len(clean_syllables)} syllables):")
-    print(f"   {' '.join(clean_syllables)}")
+    if inst.enabled:
+        inst.count('alignments', len(syllable_to_word))
+        if inst.tracing:
+            inst.event('dual.aligned', syllables=len(clean_syllables), words=len(clean_words),
+                       alignments=len(syllable_to_word))
     
-    print(f"\n📖 WORD-ENHANCED VERSION ({len(final_result)} elements):")
-    print(f"   {' '.join(final_result)}")
-    
-    if syllable_to_word:
-        print(f"\n🔗 ALIGNMENTS ({len(syllable_to_word)} syllables → words):")
-        for i, word in syllable_to_word.items():
-            syl = syllable_result[i] if i < len(syllable_result) else "?"
-            similarity = 0
-            if syl != "?" and word in clean_words:
-                similarity = syllable_word_similarity(syl, word)
-            print(f"   '{syl}' → '{word}' (similarity: {similarity:.1f})")
-    
-    print("="*70)
+    if verbose:
+        print("\n" + "="*70)
+        print("🎯 DUAL-LEVEL GENERATION RESULTS")
+        print("="*70)
+        
+        print(f"\n📝 SYLLABLE VERSION ({len(clean_syllables)} syllables):")
+        print(f"   {' '.join(clean_syllables)}")
+        
+        print(f"\n📖 WORD-ENHANCED VERSION ({len(final_result)} elements):")
+        print(f"   {' '.join(final_result)}")
+        
+        if syllable_to_word:
+            print(f"\n🔗 ALIGNMENTS ({len(syllable_to_word)} syllables → words):")
+            for i, word in syllable_to_word.items():
+                print(f"   '{syllable_result[i]}' → '{word}' (similarity: {similarities[i]:.1f})")
+        
+        print("="*70)
     
     return {
         'syllable_version': ' '.join(clean_syllables),
@@ -505,9 +1432,327 @@ def run_dual_interactive_mode(syllable_model, word_model):
             else:
                 print("❌ No valid words found")
 
-def train_word_model(text_file, max_distance=200):
-    words = text_to_words(text_file)
-    return create_fibonacci_bidirectional_word_model(words, max_distance)
+def train_word_model(text_file, max_distance=200, engine='python', shared=False, workers=1, block_size=1 << 20,
+                     intervals=None):
+    if engine == 'python' and workers <= 1:
+        return create_fibonacci_bidirectional_documents_model(
+            iter_corpus_documents(text_file), max_distance, shared=shared, intervals=intervals
+        )
+    if engine not in ('python', 'numpy'):
+        raise ValueError(f"Unknown training engine: {engine!r} (expected 'python' or 'numpy')")
+    
+    print(f"📊 Streaming bidirectional WORD model from {text_file}...")
+    pair_counts, vocab = count_corpus_pairs(
+        text_file, training_distances(intervals, max_distance), block_size=block_size, workers=workers
+    )
+    if shared:
+        word_models = pair_counts_to_shared_word_model(list(vocab), pair_counts)
+        word_models.interval_configs = intervals or {}
+    else:
+        word_models = pair_counts_to_word_models(list(vocab), pair_counts)
+    
+    print(f"✅ Forward word model: {len(word_models['forward'])} unique words")
+    print(f"✅ Backward word model: {len(word_models['backward'])} unique words")
+    return word_models
+
+def train_word_model_binary(text_file, output_path, max_distance=200, workers=1, block_size=1 << 20, top_k=None,
+                            intervals=None, memory_budget=None, pair_codes=False):
+    # memory_budget (bytes) switches to bounded, approximate counting; returns its stats
+    print(f"📊 Streaming Fibonacci pairs from {text_file}...")
+    fib_distances = training_distances(intervals, max_distance)
+    if memory_budget is None:
+        pair_counts, vocab = count_corpus_pairs(text_file, fib_distances, block_size=block_size, workers=workers)
+        row_totals, stats = None, None
+    else:
+        pair_counts, vocab, row_totals, stats = count_corpus_pairs_bounded(
+            text_file, fib_distances, memory_budget, block_size=block_size, workers=workers
+        )
+        print(f"📉 Approximate counts: {stats['pruned_pairs']} pairs pruned, "
+              f"kept counts at most {stats['error_bound']} below the true counts")
+    write_pair_counts_binary(output_path, list(vocab), pair_counts, top_k=top_k, interval_configs=intervals,
+                             row_totals=row_totals, pair_codes=pair_codes)
+    print(f"✅ Binary word model: {len(vocab)} unique words")
+    return stats
+
+def check_bounded_counts(sources, memory_budget, max_distance=200, block_size=1 << 20, intervals=None,
+                         probe_count=100, length=20):
+    # Counts the corpus exactly and under memory_budget (bytes) and checks what bounded
+    # counting promises: no kept count is above its true count or more than error_bound
+    # below it, no pair seen more than error_bound times is dropped, and row totals are exact.
+    # report['failures'] lists every promise that didn't hold. It also measures what the
+    # approximation costs, which has no bound: how many (word, distance, direction) rows get
+    # a different best mutual candidate, and how many generated positions change for the
+    # default probe prompts.
+    fib_distances = training_distances(intervals, max_distance)
+    exact_counts, vocab = count_corpus_pairs(sources, fib_distances, block_size=block_size)
+    # the exact vocabulary already holds every word, so both runs share word ids
+    kept_counts, _, row_totals, stats = count_corpus_pairs_bounded(
+        sources, fib_distances, memory_budget, vocab=vocab, block_size=block_size
+    )
+    error_bound = stats['error_bound']
+    empty = (np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64))
+    report = dict(stats, exact_pairs=0, kept_pairs=0, max_undercount=0, failures=[])
+    
+    for fib_distance in sorted(exact_counts):
+        codes, counts = exact_counts[fib_distance]
+        kept_codes, kept = kept_counts.get(fib_distance, empty)
+        report['exact_pairs'] += len(codes)
+        report['kept_pairs'] += len(kept_codes)
+        
+        order = np.argsort(codes)
+        found = np.minimum(np.searchsorted(codes[order], kept_codes), len(codes) - 1)
+        known = codes[order][found] == kept_codes
+        if not known.all():
+            report['failures'].append(f"distance {fib_distance}: {int((~known).sum())} kept pairs never occur")
+        undercount = counts[order][found[known]] - kept[known]
+        if len(undercount):
+            report['max_undercount'] = max(report['max_undercount'], int(undercount.max()))
+            if undercount.min() < 0:
+                report['failures'].append(f"distance {fib_distance}: {int((undercount < 0).sum())} counts too high")
+            if undercount.max() > error_bound:
+                report['failures'].append(f"distance {fib_distance}: {int((undercount > error_bound).sum())} "
+                                          f"counts more than {error_bound} too low")
+        
+        frequent = counts > error_bound
+        dropped = frequent & ~np.isin(codes, kept_codes)
+        if dropped.any():
+            report['failures'].append(f"distance {fib_distance}: {int(dropped.sum())} pairs seen more than "
+                                      f"{error_bound} times were dropped")
+        
+        forward, backward = row_totals[fib_distance]
+        if not (np.array_equal(forward, np.bincount(codes >> PAIR_CODE_SHIFT, counts, len(vocab)))
+                and np.array_equal(backward, np.bincount(codes & PAIR_CODE_MASK, counts, len(vocab)))):
+            report['failures'].append(f"distance {fib_distance}: row totals differ from exact training")
+    
+    report.update(compare_bounded_candidates(vocab, exact_counts, kept_counts, row_totals, probe_count, length,
+                                             interval_configs=intervals))
+    return report
+
+def compare_bounded_candidates(vocab, exact_counts, kept_counts, row_totals, probe_count=100, length=20,
+                               interval_configs=None):
+    # both models are written the way train --memory-budget writes them, so the best
+    # candidates come from the same scoring the generators use
+    vocab_words = list(vocab)
+    requests = []
+    for fib_distance, (codes, _) in sorted(exact_counts.items()):
+        for word_id in np.unique(codes >> PAIR_CODE_SHIFT).tolist():
+            requests.append((vocab_words[word_id], fib_distance, 1))
+        for word_id in np.unique(codes & PAIR_CODE_MASK).tolist():
+            requests.append((vocab_words[word_id], fib_distance, -1))
+    
+    with tempfile.TemporaryDirectory() as workdir:
+        exact_path = os.path.join(workdir, 'exact.bin')
+        bounded_path = os.path.join(workdir, 'bounded.bin')
+        write_pair_counts_binary(exact_path, vocab_words, exact_counts, interval_configs=interval_configs)
+        write_pair_counts_binary(bounded_path, vocab_words, kept_counts, interval_configs=interval_configs,
+                                 row_totals=row_totals)
+        exact, bounded = MappedWordModel(exact_path), MappedWordModel(bounded_path)
+        try:
+            before = exact.best_mutual_candidates(requests)
+            after = bounded.best_mutual_candidates(requests)
+            probe_seeds = default_probe_seeds(exact, probe_count)
+            generated_before = generate_fibonacci_bidirectional_multi_words_batch(exact, probe_seeds, length)
+            generated_after = generate_fibonacci_bidirectional_multi_words_batch(bounded, probe_seeds, length)
+        finally:
+            exact.close()
+            bounded.close()
+    
+    return {
+        'candidate_rows': len(requests),
+        'changed_candidates': sum((old and old[0]) != (new and new[0]) for old, new in zip(before, after)),
+        'probe_positions': len(probe_seeds) * length,
+        'changed_positions': sum(a != b for old, new in zip(generated_before, generated_after)
+                                 for a, b in zip(old, new)),
+    }
+
+def count_text_delta(text_file, max_distance=200, fib_distances=None, block_size=1 << 20, workers=1):
+    if fib_distances is None:
+        fib_distances = fibonacci_sequence_unique_no_pos1(max_distance)
+    pair_counts, vocab = count_corpus_pairs(text_file, fib_distances, block_size=block_size, workers=workers)
+    return list(vocab), pair_counts
+
+
+def save_pair_delta(path, vocab_words, pair_counts):
+    encoded = [word.encode('utf-8') for word in vocab_words]
+    arrays = {
+        'vocab_bytes': np.frombuffer(b''.join(encoded), dtype=np.uint8),
+        'vocab_lengths': np.array([len(word) for word in encoded], dtype=np.int64),
+        'fib_distances': np.array(sorted(pair_counts), dtype=np.int64),
+    }
+    for fib_distance, (codes, counts) in pair_counts.items():
+        arrays[f'codes_{fib_distance}'] = codes
+        arrays[f'counts_{fib_distance}'] = counts
+    with open(path, 'wb') as f:
+        np.savez(f, **arrays)
+
+
+def load_pair_delta(path):
+    with np.load(path) as data:
+        vocab_bytes = data['vocab_bytes'].tobytes()
+        ends = np.cumsum(data['vocab_lengths']).tolist()
+        vocab_words = [vocab_bytes[start:end].decode('utf-8') for start, end in zip([0] + ends, ends)]
+        pair_counts = {
+            fib_distance: (data[f'codes_{fib_distance}'], data[f'counts_{fib_distance}'])
+            for fib_distance in data['fib_distances'].tolist()
+        }
+    return vocab_words, pair_counts
+
+
+def merge_pair_deltas(deltas):
+    # deltas in the order their text was added
+    vocab = {}
+    remapped = []
+    for vocab_words, pair_counts in deltas:
+        ids = np.array([vocab.setdefault(word, len(vocab)) for word in vocab_words], dtype=np.int64)
+        remapped.append({
+            fib_distance: (
+                (ids[codes >> PAIR_CODE_SHIFT] << PAIR_CODE_SHIFT) | ids[codes & PAIR_CODE_MASK], counts
+            )
+            for fib_distance, (codes, counts) in pair_counts.items()
+        })
+    return list(vocab), merge_pair_counts(remapped)
+
+
+def apply_pair_delta(word_models, vocab_words, pair_counts):
+    if isinstance(word_models, MappedWordModel):
+        raise TypeError("Binary word models are read-only; use merge_delta_into_binary to write an updated file")
+    if isinstance(word_models, RankedWordModel):
+        apply_pair_delta(word_models.base, vocab_words, pair_counts)
+        return build_ranked_candidate_index(word_models.base, word_models.top_k)
+    
+    word_array = np.array(vocab_words, dtype=object)
+    add_pairs = getattr(word_models, 'add_pairs', None)
+    forward_model = word_models['forward']
+    backward_model = word_models['backward']
+    
+    # smallest distance first, so new words and distances land in training order
+    for fib_distance in sorted(pair_counts):
+        codes, counts = pair_counts[fib_distance]
+        left_words = word_array[codes >> PAIR_CODE_SHIFT].tolist()
+        right_words = word_array[codes & PAIR_CODE_MASK].tolist()
+        counts = counts.tolist()
+        if add_pairs is not None:
+            add_pairs(fib_distance, left_words, right_words, counts)
+            continue
+        
+        for left, right, count in zip(left_words, right_words, counts):
+            for model, word, partner in ((forward_model, left, right), (backward_model, right, left)):
+                rows = model.setdefault(word, {})
+                row = rows.get(fib_distance)
+                if row is None:
+                    row = rows[fib_distance] = Counter()
+                row[partner] += count
+    
+    return word_models
+
+
+def merge_delta_into_binary(model_path, vocab_words, pair_counts, output_path):
+    model = MappedWordModel(model_path)
+    delta_tables = {
+        fib_distance: (codes >> PAIR_CODE_SHIFT, codes & PAIR_CODE_MASK, counts)
+        for fib_distance, (codes, counts) in pair_counts.items()
+    }
+    merge_into_binary_word_model(model, vocab_words, delta_tables, output_path)
+    model.close()
+
+
+def update_word_model_file(model_path, output_path, text_sources=(), delta_paths=(), max_distance=200,
+                           delta_output=None, block_size=1 << 20, workers=1):
+    binary = is_binary_word_model(model_path)
+    word_models = None
+    if binary:
+        model = MappedWordModel(model_path)
+        fib_distances = model.fib_distances
+        model.close()
+    else:
+        # the delta is counted at the distances the pickle was trained with; max_distance
+        # only applies to dict models, which don't record them
+        word_models = load_word_model(model_path)
+        interval_configs = getattr(word_models, 'interval_configs', None)
+        if interval_configs:
+            fib_distances = training_distances(interval_configs)
+        else:
+            fib_distances = getattr(word_models, 'fib_distances', None)
+    
+    deltas = [load_pair_delta(path) for path in delta_paths]
+    if text_sources:
+        print(f"📊 Counting new text: {' '.join(map(str, text_sources))}")
+        deltas.append(count_text_delta(
+            text_sources, max_distance, fib_distances=fib_distances, block_size=block_size, workers=workers
+        ))
+    vocab_words, pair_counts = merge_pair_deltas(deltas)
+    added = sum(int(counts.sum()) for _, counts in pair_counts.values())
+    print(f"➕ Delta: {len(vocab_words)} words, {added} pair occurrences")
+    
+    if delta_output:
+        save_pair_delta(delta_output, vocab_words, pair_counts)
+        print(f"💾 Saved delta to: {delta_output}")
+    if not output_path:
+        return
+    
+    if binary:
+        merge_delta_into_binary(model_path, vocab_words, pair_counts, output_path)
+    else:
+        word_models = apply_pair_delta(word_models, vocab_words, pair_counts)
+        with open(output_path, 'wb') as f:
+            pickle.dump(word_models, f)
+    print(f"💾 Updated word model written to: {output_path}")
+
+
+def default_probe_seeds(word_models, probe_count=100):
+    # the first words of the model's own order, alone and in pairs, so the set is fixed per model
+    words = list(islice(word_models['forward'], probe_count))
+    return [[word] for word in words] + [words[i:i + 2] for i in range(0, len(words) - 1, 2)]
+
+
+def pruning_report(model_path, pruned_path, probe_seeds=None, probe_count=100, length=20):
+    original = load_word_model(model_path)
+    pruned = load_word_model(pruned_path)
+    if probe_seeds is None:
+        probe_seeds = default_probe_seeds(original, probe_count)
+    
+    # the batch generator returns exactly what generate_fibonacci_bidirectional_multi_words does
+    before = generate_fibonacci_bidirectional_multi_words_batch(original, probe_seeds, length)
+    after = generate_fibonacci_bidirectional_multi_words_batch(pruned, probe_seeds, length)
+    changed_positions = sum(a != b for old, new in zip(before, after) for a, b in zip(old, new))
+    report = {
+        'size_before': os.path.getsize(model_path),
+        'size_after': os.path.getsize(pruned_path),
+        'probe_prompts': len(probe_seeds),
+        'changed_prompts': sum(old != new for old, new in zip(before, after)),
+        'probe_positions': len(probe_seeds) * length,
+        'changed_positions': changed_positions,
+    }
+    for model in (original, pruned):
+        if isinstance(model, MappedWordModel):
+            model.close()
+    return report
+
+
+def prune_word_model_file(model_path, output_path, min_count=1, top_n=None, min_word_count=0,
+                          count_bits=None, probe_seeds=None, probe_count=100, length=20):
+    if is_binary_word_model(model_path):
+        model = MappedWordModel(model_path)
+    else:
+        print(f"🔁 Converting {model_path} to the binary format first")
+        model = convert_pickle_model(model_path, output_path)
+    stats = prune_binary_word_model(
+        model, output_path, min_count=min_count, top_n=top_n,
+        min_word_count=min_word_count, count_bits=count_bits
+    )
+    model.close()
+    
+    report = dict(stats, **pruning_report(model_path, output_path, probe_seeds, probe_count, length))
+    print(f"✂️  Pruned {model_path} -> {output_path}")
+    print(f"   Entries: {report['entries_before']:,} -> {report['entries_after']:,}")
+    print(f"   Vocabulary: {report['vocab_before']:,} -> {report['vocab_after']:,}")
+    print(f"   Size: {report['size_before']:,} -> {report['size_after']:,} bytes "
+          f"({report['size_after'] / max(report['size_before'], 1):.1%})")
+    if count_bits:
+        print(f"   Counts saturated at {count_bits} bits: {report['saturated_counts']:,}")
+    print(f"🔍 Probe set: {report['changed_prompts']}/{report['probe_prompts']} outputs changed, "
+          f"{report['changed_positions']}/{report['probe_positions']} positions")
+    return report
 
 def test_dual_generation(syllable_model, word_model, test_phrases):
     print('🚀 DUAL-LEVEL FIBONACCI COMPARISON TESTS')
@@ -531,17 +1776,197 @@ def test_dual_generation(syllable_model, word_model, test_phrases):
         print(f'   {" ".join(dual_result)}')
         print('\n' + '-'*50)
 
-if __name__ == '__main__':
-    import pickle
-
-    input_text_file = 'test.txt'
-    output_model_file = 'fibonacci_word_model.pkl'
-
-    print(f"🚀 Starting word model training from: {input_text_file}")
-    word_model = train_word_model(input_text_file, max_distance=200)
+def main(argv=None):
+    import argparse
+    
+    parser = argparse.ArgumentParser(description="Train and manage Fibonacci word models")
+    commands = parser.add_subparsers(dest='command')
+    
+    train = commands.add_parser('train', help="train a word model from a text file")
+    train.add_argument('--input', nargs='+', default=['test.txt'],
+                       help="text files, directories of .txt files, or glob patterns")
+    train.add_argument('--output', default='fibonacci_word_model.bin')
+    train.add_argument('--max-distance', type=int, default=200)
+    train.add_argument('--format', choices=('binary', 'pickle'), default='binary')
+    train.add_argument('--workers', type=int, default=1, help="worker processes for sharded counting")
+    train.add_argument('--block-size', type=int, default=1 << 20, help="tokens per streamed counting block")
+    train.add_argument('--top-k', type=int, help="store the top-K ranked candidates per (word, distance, direction)")
+    train.add_argument('--memory-budget', type=float, metavar='MB',
+                       help="bound the pair tables to this many MB with approximate (lossy) counting; binary only. "
+                            "This is not a bound on process memory: merging, blocks being counted and writing "
+                            "the model take more on top. Once pruning starts, generated text changes noticeably; "
+                            "check-budget measures by how much")
+    train.add_argument('--interval', action='append', default=[], metavar='NAME=SPEC',
+                       help="named interval set trained in the same pass, e.g. fib=fibonacci, "
+                            "luc=lucas@2=1.5 or custom=2,5,9 (repeatable)")
+    train.add_argument('--pair-codes', action='store_true',
+                       help="also store sorted pair codes, so scoring reads its lookup from the file instead of "
+                            "building one in memory (a larger file); binary only")
+    
+    convert = commands.add_parser('convert', help="convert a pickled word model to the binary format")
+    convert.add_argument('pickle_path')
+    convert.add_argument('binary_path')
+    convert.add_argument('--top-k', type=int, help="store the top-K ranked candidates per (word, distance, direction)")
+    convert.add_argument('--pair-codes', action='store_true',
+                         help="also store sorted pair codes, so scoring reads its lookup from the file instead of "
+                              "building one in memory (a larger file)")
+    
+    prune = commands.add_parser('prune', help="prune a word model and report the size/quality trade-off")
+    prune.add_argument('--model', required=True)
+    prune.add_argument('--output', required=True, help="pruned binary model path")
+    prune.add_argument('--min-count', type=int, default=1, help="drop pairs seen fewer times")
+    prune.add_argument('--top-n', type=int, help="keep only the top N candidates per (word, distance, direction)")
+    prune.add_argument('--min-word-count', type=int, default=0, help="drop words seen fewer times")
+    prune.add_argument('--count-bits', type=int, choices=(8, 16, 32), help="store counts in this many bits")
+    prune.add_argument('--probe', nargs='*', help="probe prompts, comma-separated seed words each")
+    prune.add_argument('--probe-count', type=int, default=100, help="words in the default probe set")
+    prune.add_argument('--length', type=int, default=20, help="generated length for the probe set")
+    prune.add_argument('--report', help="also write the report as JSON here")
+    
+    score = commands.add_parser('score', help="score documents (one per line) for Fibonacci coherence")
+    score.add_argument('--model', required=True)
+    score.add_argument('--input', nargs='*', default=[], help="files with one document per line (default: stdin)")
+    score.add_argument('--intervals', help="named interval configuration to score with")
+    score.add_argument('--batch-size', type=int, default=1024, help="documents scored per vectorised batch")
+    score.add_argument('--rank', action='store_true', help="print documents best first instead of in input order")
+    
+    related = commands.add_parser('related', help="expand seed words into N distinct related words")
+    related.add_argument('seeds', nargs='+', help="seed words")
+    related.add_argument('--model', help="word model to build the association lists from")
+    related.add_argument('--index', help="saved association lists (.npz) to load instead of building them")
+    related.add_argument('--save-index', help="write the association lists here for later queries")
+    related.add_argument('--top-m', type=int, default=100, help="associated words kept per word")
+    related.add_argument('--intervals', help="named interval configuration to build with")
+    related.add_argument('-n', type=int, default=50, help="related words to return")
+    related.add_argument('--hops', type=int, default=2)
+    related.add_argument('--beam', type=int, default=25, help="words expanded per hop")
+    
+    check_budget = commands.add_parser(
+        'check-budget', help="check bounded counting against exact counting on the same corpus"
+    )
+    check_budget.add_argument('--input', nargs='*', default=[],
+                              help="text files, directories or glob patterns (default: a synthetic Zipf corpus)")
+    check_budget.add_argument('--memory-budget', type=float, default=1.0, metavar='MB',
+                              help="pair-table budget to count under; small enough to force pruning")
+    check_budget.add_argument('--tokens', type=int, default=200000, help="size of the synthetic corpus")
+    check_budget.add_argument('--max-distance', type=int, default=200)
+    check_budget.add_argument('--block-size', type=int, default=1 << 16, help="tokens per streamed counting block")
+    
+    update = commands.add_parser('update', help="fold new text or saved deltas into an existing word model")
+    update.add_argument('--model', required=True)
+    update.add_argument('--input', nargs='*', default=[], help="new text files, directories or glob patterns")
+    update.add_argument('--delta', nargs='*', default=[], help="previously saved .npz deltas to merge")
+    update.add_argument('--output', help="updated model path (binary models stay binary)")
+    update.add_argument('--save-delta', help="also write the combined delta here to merge later")
+    update.add_argument('--max-distance', type=int, default=200, help="for pickled models only")
+    update.add_argument('--workers', type=int, default=1)
+    
+    if argv is None:
+        argv = sys.argv[1:]
+    args = parser.parse_args(argv or ['train'])
+    
+    if args.command == 'train':
+        try:
+            intervals = dict(parse_interval_spec(spec, args.max_distance) for spec in args.interval) or None
+        except ValueError as e:
+            parser.error(str(e))
+        if args.memory_budget and args.format != 'binary':
+            parser.error("--memory-budget needs --format binary")
+        if args.pair_codes and args.format != 'binary':
+            parser.error("--pair-codes needs --format binary")
+        print(f"🚀 Starting word model training from: {' '.join(args.input)}")
+        if args.format == 'binary':
+            print(f"💾 Writing binary word model to: {args.output}")
+            train_word_model_binary(
+                args.input, args.output, max_distance=args.max_distance,
+                workers=args.workers, block_size=args.block_size, top_k=args.top_k, intervals=intervals,
+                memory_budget=int(args.memory_budget * (1 << 20)) if args.memory_budget else None,
+                pair_codes=args.pair_codes
+            )
+        else:
+            word_model = train_word_model(
+                args.input, max_distance=args.max_distance, engine='numpy', shared=True,
+                workers=args.workers, block_size=args.block_size, intervals=intervals
+            )
+            if args.top_k:
+                word_model = build_ranked_candidate_index(word_model, args.top_k)
+            print(f"💾 Saving trained word model to: {args.output}")
+            with open(args.output, 'wb') as f:
+                pickle.dump(word_model, f)
+        print("✅ Word model training and saving complete.")
+    
+    elif args.command == 'convert':
+        print(f"🔁 Converting {args.pickle_path} -> {args.binary_path}")
+        model = convert_pickle_model(args.pickle_path, args.binary_path, top_k=args.top_k,
+                                     pair_codes=args.pair_codes)
+        print(f"✅ Binary word model: {len(model.vocab)} words, distances {model.fib_distances}")
+        model.close()
+    
+    elif args.command == 'update':
+        if not args.input and not args.delta:
+            parser.error("update needs --input text and/or --delta files")
+        if not args.output and not args.save_delta:
+            parser.error("update needs --output and/or --save-delta")
+        update_word_model_file(
+            args.model, args.output, text_sources=args.input, delta_paths=args.delta,
+            max_distance=args.max_distance, delta_output=args.save_delta, workers=args.workers
+        )
+    
+    elif args.command == 'prune':
+        probe_seeds = [prompt.split(',') for prompt in args.probe] if args.probe else None
+        report = prune_word_model_file(
+            args.model, args.output, min_count=args.min_count, top_n=args.top_n,
+            min_word_count=args.min_word_count, count_bits=args.count_bits,
+            probe_seeds=probe_seeds, probe_count=args.probe_count, length=args.length
+        )
+        if args.report:
+            with open(args.report, 'w') as f:
+                json.dump(report, f, indent=2)
+    
+    elif args.command == 'score':
+        word_models = load_word_model(args.model)
+        scored = iter_document_scores(word_models, iter_document_lines(args.input),
+                                      batch_size=args.batch_size, intervals=args.intervals)
+        if args.rank:
+            scored = sorted(scored, key=lambda item: item[1], reverse=True)
+        for document, doc_score in scored:
+            print(f"{doc_score:.6g}\t{document}")
+    
+    elif args.command == 'related':
+        if args.index:
+            related_index = RelatedWordIndex.load(args.index)
+        elif args.model:
+            print(f"🔗 Building association lists from: {args.model}")
+            related_index = build_related_word_index(load_word_model(args.model), args.top_m, args.intervals)
+        else:
+            parser.error("related needs --model or --index")
+        if args.save_index:
+            related_index.save(args.save_index)
+            print(f"💾 Association lists saved to: {args.save_index}")
+        seed_words = [word for seed in args.seeds for word in WORD_PATTERN.findall(seed.lower())]
+        print(' '.join(expand_related_words(related_index, seed_words, args.n, args.hops, args.beam)))
+    
+    elif args.command == 'check-budget':
+        with tempfile.TemporaryDirectory() as workdir:
+            sources = args.input
+            if not sources:
+                from fibonacci_benchmarks import write_zipf_corpus
+                sources = [os.path.join(workdir, 'zipf.txt')]
+                write_zipf_corpus(sources[0], args.tokens, vocab_size=5000)
+            print(f"🔬 Counting {' '.join(sources)} exactly and within {args.memory_budget} MB")
+            report = check_bounded_counts(sources, int(args.memory_budget * (1 << 20)),
+                                          max_distance=args.max_distance, block_size=args.block_size)
+        print(f"   Pairs: {report['exact_pairs']:,} exact, {report['kept_pairs']:,} kept after "
+              f"{report['prunes']} prunes")
+        print(f"   Largest undercount: {report['max_undercount']} (error bound {report['error_bound']})")
+        print(f"   Best candidate changed in {report['changed_candidates']:,} of {report['candidate_rows']:,} rows; "
+              f"{report['changed_positions']:,} of {report['probe_positions']:,} generated positions changed")
+        if report['failures']:
+            for failure in report['failures']:
+                print(f"❌ {failure}")
+            parser.exit(1)
+        print("✅ Bounded counts are within the error bound")
 
-    print(f"💾 Saving trained word model to: {output_model_file}")
-    with open(output_model_file, 'wb') as f:
-        pickle.dump(word_model, f)
 
-    print("✅ Word model training and saving complete.")
+if __name__ == '__main__':
+    main()
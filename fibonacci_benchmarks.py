@@ -0,0 +1,310 @@
+#!/usr/bin/env python3
+import contextlib
+import io
+import json
+import os
+import pickle
+import platform
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+
+import numpy as np
+
+from create_models import (
+    best_syllable_split,
+    create_fibonacci_bidirectional_word_model,
+    generate_fibonacci_bidirectional_multi_words,
+    generate_fibonacci_bidirectional_words,
+    generate_fibonacci_diffusion_words,
+    generate_fibonacci_dual_level,
+    score_documents,
+    text_to_words
+)
+from fibonacci_word_store import load_word_model, save_word_model_binary
+
+
+SYLLABLE_PARTS = ['ka', 'ne', 'ro', 'mi', 'ta', 'lu', 'phe', 'si', 'vo', 'zu', 'da', 'bri', 'sto', 'en', 'or', 'ith']
+
+TRAINING_STAGES = ['text_to_words', 'train_python', 'train_numpy', 'save_pickle', 'load_pickle',
+                   'save_binary', 'load_binary']
+GENERATION_STAGES = ['generate_words', 'generate_multi', 'generate_diffusion', 'generate_dual', 'score_documents']
+SCORED_DOCUMENTS = 2000
+
+
+def synthetic_vocabulary(vocab_size, seed=0):
+    rng = np.random.default_rng(seed)
+    seen = set()
+    vocab = []
+    while len(vocab) < vocab_size:
+        word = ''.join(rng.choice(SYLLABLE_PARTS, rng.integers(1, 6)))
+        if word not in seen:
+            seen.add(word)
+            vocab.append(word)
+    return vocab
+
+
+def write_zipf_corpus(path, n_tokens, vocab_size=20000, exponent=1.1, seed=0, words_per_line=12):
+    # word i of the vocabulary has rank i + 1, so the same seed always gives the same corpus
+    vocab = synthetic_vocabulary(vocab_size, seed)
+    weights = 1.0 / np.arange(1, vocab_size + 1) ** exponent
+    rng = np.random.default_rng(seed + 1)
+    ids = rng.choice(vocab_size, size=n_tokens, p=weights / weights.sum())
+    with open(path, 'w', encoding='utf-8') as f:
+        for start in range(0, n_tokens, words_per_line):
+            f.write(' '.join(vocab[i] for i in ids[start:start + words_per_line]) + '.\n')
+    return vocab
+
+
+def probe_prompts(vocab, count=20, seed=0):
+    # seeds drawn from the 200 most frequent words, one to three per prompt
+    rng = np.random.default_rng(seed + 2)
+    common = vocab[:200]
+    return [[common[i] for i in rng.choice(len(common), rng.integers(1, 4), replace=False)]
+            for _ in range(count)]
+
+
+def _memory_mb(field):
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith(f'{field}:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    import resource
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is KiB on Linux and bytes on macOS
+    return peak / (1 << 20) if sys.platform == 'darwin' else peak / 1024
+
+
+def _reset_peak_rss():
+    # Linux resets VmHWM to the current RSS, so the peak covers only the timed stage
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+    except OSError:
+        pass
+
+
+def _prepare_stage(stage, files, model_kind):
+    if stage in ('train_python', 'train_numpy', 'save_pickle', 'save_binary'):
+        words = text_to_words(files['corpus'])
+        if stage.startswith('train'):
+            return words
+        return create_fibonacci_bidirectional_word_model(words, files['max_distance'], engine='numpy')
+    if stage in GENERATION_STAGES:
+        word_models = load_word_model(files[model_kind])
+        if stage == 'generate_dual':
+            with open(files['syllable_model'], 'rb') as f:
+                return pickle.load(f), word_models
+        if stage == 'score_documents':
+            with open(files['corpus'], encoding='utf-8') as f:
+                return word_models, [line for line, _ in zip(f, range(SCORED_DOCUMENTS))]
+        return word_models
+    return None
+
+
+def _run_stage(stage, files, model_kind, prompts, length, diffusion_steps):
+    with contextlib.redirect_stdout(io.StringIO()):
+        prepared = _prepare_stage(stage, files, model_kind)
+    max_distance = files['max_distance']
+    output_path = os.path.join(files['workdir'], f'bench_output_{os.getpid()}')
+    
+    _reset_peak_rss()
+    rss_before = _memory_mb('VmRSS')
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        if stage == 'text_to_words':
+            tokens = len(text_to_words(files['corpus']))
+        elif stage == 'train_python':
+            create_fibonacci_bidirectional_word_model(prepared, max_distance, engine='python')
+            tokens = len(prepared)
+        elif stage == 'train_numpy':
+            create_fibonacci_bidirectional_word_model(prepared, max_distance, engine='numpy')
+            tokens = len(prepared)
+        elif stage == 'save_pickle':
+            with open(output_path, 'wb') as f:
+                pickle.dump(prepared, f)
+            tokens = files['tokens']
+        elif stage == 'load_pickle':
+            with open(files['dict'], 'rb') as f:
+                pickle.load(f)
+            tokens = files['tokens']
+        elif stage == 'save_binary':
+            save_word_model_binary(prepared, output_path)
+            tokens = files['tokens']
+        elif stage == 'load_binary':
+            load_word_model(files['binary']).close()
+            tokens = files['tokens']
+        elif stage == 'generate_words':
+            for seed_words in prompts:
+                generate_fibonacci_bidirectional_words(prepared, seed_words[0], 1, length)
+            tokens = len(prompts) * length
+        elif stage == 'generate_multi':
+            for seed_words in prompts:
+                generate_fibonacci_bidirectional_multi_words(prepared, seed_words, length, verbose=False)
+            tokens = len(prompts) * length
+        elif stage == 'generate_diffusion':
+            for seed_words in prompts:
+                generate_fibonacci_diffusion_words(prepared, seed_words, length, diffusion_steps, verbose=False)
+            tokens = len(prompts) * length
+        elif stage == 'generate_dual':
+            syllable_models, word_models = prepared
+            for seed_words in prompts:
+                generate_fibonacci_dual_level(syllable_models, word_models, seed_words, length, verbose=False)
+            tokens = len(prompts) * length
+        elif stage == 'score_documents':
+            word_models, documents = prepared
+            score_documents(word_models, documents)
+            tokens = sum(len(document.split()) for document in documents)
+        else:
+            raise ValueError(f"Unknown benchmark stage: {stage}")
+    seconds = time.perf_counter() - start
+    
+    peak_rss = _memory_mb('VmHWM')
+    if os.path.exists(output_path):
+        os.remove(output_path)
+    return {
+        'seconds': seconds,
+        'tokens': tokens,
+        'tokens_per_s': tokens / seconds if seconds else None,
+        'rss_before_mb': round(rss_before, 1),
+        'peak_rss_mb': round(peak_rss, 1),
+    }
+
+
+def prepare_corpus_files(workdir, n_tokens, vocab_size, max_distance, seed):
+    files = {'workdir': workdir, 'max_distance': max_distance}
+    files['corpus'] = os.path.join(workdir, f'zipf_{n_tokens}.txt')
+    vocab = write_zipf_corpus(files['corpus'], n_tokens, vocab_size, seed=seed)
+    
+    words = text_to_words(files['corpus'])
+    files['tokens'] = len(words)
+    with contextlib.redirect_stdout(io.StringIO()):
+        word_models = create_fibonacci_bidirectional_word_model(words, max_distance, engine='numpy')
+        files['dict'] = os.path.join(workdir, f'zipf_{n_tokens}_words.pkl')
+        with open(files['dict'], 'wb') as f:
+            pickle.dump(word_models, f)
+        files['binary'] = os.path.join(workdir, f'zipf_{n_tokens}_words.bin')
+        save_word_model_binary(word_models, files['binary'])
+        
+        # syllable models share the word models' layout, so the same trainer builds one
+        syllables = [syllable for word in words for syllable in best_syllable_split(word)]
+        syllable_models = create_fibonacci_bidirectional_word_model(syllables, max_distance, engine='numpy')
+        files['syllable_model'] = os.path.join(workdir, f'zipf_{n_tokens}_syllables.pkl')
+        with open(files['syllable_model'], 'wb') as f:
+            pickle.dump(syllable_models, f)
+    return files, vocab
+
+
+def run_benchmarks(sizes=(20000, 100000), vocab_size=20000, max_distance=200, stages=None,
+                   model_kinds=('dict', 'binary'), prompts=20, length=20, diffusion_steps=3,
+                   repeat=1, seed=0, workdir=None):
+    stages = stages or TRAINING_STAGES + GENERATION_STAGES
+    results = []
+    with tempfile.TemporaryDirectory(dir=workdir) as tmp:
+        for n_tokens in sizes:
+            print(f"📚 Preparing Zipf corpus: {n_tokens:,} tokens, {vocab_size:,} word vocabulary")
+            files, vocab = prepare_corpus_files(tmp, n_tokens, vocab_size, max_distance, seed)
+            seed_prompts = probe_prompts(vocab, prompts, seed)
+            
+            for stage in stages:
+                for model_kind in (model_kinds if stage in GENERATION_STAGES else (None,)):
+                    runs = []
+                    for _ in range(repeat):
+                        # a fresh interpreter per run, so peak RSS and caches belong to this stage alone
+                        with ProcessPoolExecutor(max_workers=1, mp_context=get_context('spawn')) as pool:
+                            runs.append(pool.submit(
+                                _run_stage, stage, files, model_kind, seed_prompts, length, diffusion_steps
+                            ).result())
+                    best = min(runs, key=lambda run: run['seconds'])
+                    result = dict(best, stage=stage, model=model_kind, corpus_tokens=files['tokens'],
+                                  peak_rss_mb=max(run['peak_rss_mb'] for run in runs))
+                    results.append(result)
+                    label = stage if model_kind is None else f"{stage}[{model_kind}]"
+                    print(f"  ⏱️  {label:<28} {result['seconds']:9.4f}s  "
+                          f"{result['tokens_per_s'] or 0:14,.0f} tok/s  {result['peak_rss_mb']:8.1f} MB peak")
+    
+    return {
+        'meta': {
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'vocab_size': vocab_size,
+            'max_distance': max_distance,
+            'prompts': prompts,
+            'length': length,
+            'diffusion_steps': diffusion_steps,
+            'repeat': repeat,
+            'seed': seed,
+        },
+        'results': results,
+    }
+
+
+def _result_key(result):
+    return result['stage'], result['model'], result['corpus_tokens']
+
+
+def compare_with_baseline(results, baseline):
+    baseline_results = {_result_key(result): result for result in baseline['results']}
+    comparison = []
+    for result in results['results']:
+        previous = baseline_results.get(_result_key(result))
+        if previous is None:
+            continue
+        comparison.append({
+            'stage': result['stage'],
+            'model': result['model'],
+            'corpus_tokens': result['corpus_tokens'],
+            'speedup': previous['seconds'] / result['seconds'] if result['seconds'] else None,
+            'peak_rss_ratio': result['peak_rss_mb'] / previous['peak_rss_mb'] if previous['peak_rss_mb'] else None,
+        })
+    return comparison
+
+
+def main(argv=None):
+    import argparse
+    
+    parser = argparse.ArgumentParser(description="Benchmark Fibonacci word model training, loading and generation")
+    parser.add_argument('--sizes', type=int, nargs='+', default=[20000, 100000], help="corpus sizes in tokens")
+    parser.add_argument('--vocab-size', type=int, default=20000)
+    parser.add_argument('--max-distance', type=int, default=200)
+    parser.add_argument('--stages', nargs='+', choices=TRAINING_STAGES + GENERATION_STAGES)
+    parser.add_argument('--models', nargs='+', choices=('dict', 'binary'), default=['dict', 'binary'],
+                        help="model formats the generation stages run against")
+    parser.add_argument('--prompts', type=int, default=20)
+    parser.add_argument('--length', type=int, default=20)
+    parser.add_argument('--diffusion-steps', type=int, default=3)
+    parser.add_argument('--repeat', type=int, default=1, help="runs per stage; the fastest is kept")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--workdir', help="directory for the generated corpora and models")
+    parser.add_argument('--output', default='benchmark_results.json')
+    parser.add_argument('--baseline', help="earlier results JSON to compare against")
+    args = parser.parse_args(argv)
+    
+    results = run_benchmarks(
+        sizes=args.sizes, vocab_size=args.vocab_size, max_distance=args.max_distance, stages=args.stages,
+        model_kinds=args.models, prompts=args.prompts, length=args.length,
+        diffusion_steps=args.diffusion_steps, repeat=args.repeat, seed=args.seed, workdir=args.workdir
+    )
+    if args.baseline:
+        with open(args.baseline) as f:
+            results['comparison'] = compare_with_baseline(results, json.load(f))
+        print(f"\n📈 Compared with {args.baseline}:")
+        for row in results['comparison']:
+            label = row['stage'] if row['model'] is None else f"{row['stage']}[{row['model']}]"
+            print(f"  {label:<28} {row['corpus_tokens']:>10,} tokens  {row['speedup']:6.2f}x speed  "
+                  f"{row['peak_rss_ratio']:5.2f}x peak RSS")
+    
+    with open(args.output, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f"💾 Benchmark results written to: {args.output}")
+
+
+if __name__ == '__main__':
+    main()
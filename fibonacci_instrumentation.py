@@ -0,0 +1,116 @@
+import functools
+import logging
+import time
+from collections import Counter
+from contextlib import contextmanager, nullcontext
+from contextvars import ContextVar
+
+
+class Instrumentation:
+    # Collects per-stage timers and counters; events go to the callback, the logger
+    # and/or an in-memory trace, whichever are given.
+    enabled = True
+
+    def __init__(self, callback=None, logger=None, keep_events=False):
+        self.callback = callback
+        self.logger = logger
+        self.keep_events = keep_events
+        self.counters = Counter()
+        self.timings = {}
+        self.events = []
+
+    @property
+    def tracing(self):
+        return self.callback is not None or self.logger is not None or self.keep_events
+
+    def count(self, name, amount=1):
+        self.counters[name] += amount
+
+    @contextmanager
+    def timer(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            calls, seconds = self.timings.get(name, (0, 0.0))
+            self.timings[name] = (calls + 1, seconds + time.perf_counter() - start)
+
+    def event(self, name, **fields):
+        if self.callback is not None:
+            self.callback(name, fields)
+        if self.logger is not None:
+            self.logger.debug("%s %s", name, fields)
+        if self.keep_events:
+            self.events.append((name, fields))
+
+    def summary(self):
+        return {
+            'counters': dict(self.counters),
+            'timings': {name: {'calls': calls, 'seconds': seconds} for name, (calls, seconds) in self.timings.items()},
+        }
+
+    def reset(self):
+        self.counters.clear()
+        self.timings.clear()
+        self.events.clear()
+
+
+class NullInstrumentation:
+    # The default: every hook is a no-op, and callers check `enabled` before building
+    # event fields or counting inside loops.
+    enabled = False
+    tracing = False
+    _timer = nullcontext()
+
+    def count(self, name, amount=1):
+        pass
+
+    def timer(self, name):
+        return self._timer
+
+    def event(self, name, **fields):
+        pass
+
+    def summary(self):
+        return {'counters': {}, 'timings': {}}
+
+
+NULL_INSTRUMENTATION = NullInstrumentation()
+
+_active_instrumentation = ContextVar('fibonacci_instrumentation', default=NULL_INSTRUMENTATION)
+
+
+def get_instrumentation():
+    return _active_instrumentation.get()
+
+
+@contextmanager
+def instrumented(instrumentation=None, logger=None, callback=None, keep_events=False):
+    # with instrumented() as inst: ... runs training/generation with inst collecting stats
+    if instrumentation is None:
+        instrumentation = Instrumentation(callback=callback, logger=logger, keep_events=keep_events)
+    token = _active_instrumentation.set(instrumentation)
+    try:
+        yield instrumentation
+    finally:
+        _active_instrumentation.reset(token)
+
+
+def timed(name):
+    # Times every call of the decorated function under `name` while instrumentation is on;
+    # when it is off the only cost is one context variable lookup.
+    def decorate(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            instrumentation = _active_instrumentation.get()
+            if not instrumentation.enabled:
+                return func(*args, **kwargs)
+            with instrumentation.timer(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def logging_instrumentation(name='fibonacci'):
+    # events are logged at DEBUG level on this logger
+    return Instrumentation(logger=logging.getLogger(name))
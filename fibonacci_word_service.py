@@ -0,0 +1,376 @@
+#!/usr/bin/env python3
+import asyncio
+import json
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_all_start_methods, get_context
+from urllib.parse import parse_qs, urlsplit
+
+from create_models import (
+    WORD_PATTERN,
+    build_related_word_index,
+    expand_related_words,
+    generate_fibonacci_bidirectional_multi_words_batch,
+    generate_fibonacci_diffusion_words,
+    resolve_intervals,
+    score_documents
+)
+from fibonacci_word_store import MappedWordModel, RelatedWordIndex, load_word_model, pair_score_index
+
+
+MAX_LENGTH = 500
+MAX_DIFFUSION_STEPS = 20
+MAX_BODY_BYTES = 1 << 20
+
+HTTP_REASONS = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed',
+                413: 'Payload Too Large', 500: 'Internal Server Error'}
+
+
+class RequestError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+def normalise_seeds(seeds):
+    if isinstance(seeds, str):
+        seeds = [seeds]
+    if not isinstance(seeds, (list, tuple)):
+        raise RequestError(400, "'seeds' must be a string or a list of strings")
+    words = []
+    for seed in seeds:
+        if not isinstance(seed, str):
+            raise RequestError(400, "'seeds' must be a string or a list of strings")
+        words.extend(WORD_PATTERN.findall(seed.lower()))
+    if not words:
+        raise RequestError(400, "no seed words given")
+    return tuple(words)
+
+
+def int_param(params, name, default, low, high):
+    value = params.get(name, default)
+    try:
+        value = int(value)
+    except (TypeError, ValueError):
+        raise RequestError(400, f"'{name}' must be an integer")
+    if not low <= value <= high:
+        raise RequestError(400, f"'{name}' must be between {low} and {high}")
+    return value
+
+
+def interval_param(word_models, params):
+    name = params.get('intervals')
+    if name is None:
+        return None
+    if not isinstance(name, str):
+        raise RequestError(400, "'intervals' must be the name of an interval configuration")
+    try:
+        resolve_intervals(word_models, name)
+    except ValueError as e:
+        raise RequestError(400, str(e))
+    return name
+
+
+def _build_mapped_related_index(path, top_m, intervals):
+    return build_related_word_index(MappedWordModel(path), top_m, intervals)
+
+
+def related_word_index(word_models, top_m=100, intervals=None):
+    # Sorting every pair takes several times the finished index in temporaries, and the
+    # allocator keeps that heap after they're freed; a mapped model's lists are built in a
+    # child process mapping the same file, so the service never holds that memory.
+    # (forkserver: the service has threads running, which a forked child can't rely on)
+    if not isinstance(word_models, MappedWordModel):
+        return build_related_word_index(word_models, top_m, intervals)
+    mp_context = get_context('forkserver' if 'forkserver' in get_all_start_methods() else 'spawn')
+    with ProcessPoolExecutor(max_workers=1, mp_context=mp_context) as pool:
+        return pool.submit(_build_mapped_related_index, word_models.path, top_m, intervals).result()
+
+
+class LRUCache:
+    def __init__(self, max_size=1024):
+        self.max_size = max_size
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        if key in self.entries:
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return self.entries[key]
+        self.misses += 1
+        return None
+
+    def put(self, key, value):
+        if self.max_size <= 0:
+            return
+        self.entries[key] = value
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+
+    def discard(self, key, value):
+        if self.entries.get(key) is value:
+            del self.entries[key]
+
+
+class ServiceStats:
+    def __init__(self, window=1024):
+        self.started = time.monotonic()
+        self.requests = 0
+        self.errors = 0
+        self.by_endpoint = {}
+        self.latencies = deque(maxlen=window)
+
+    def record(self, endpoint, latency, ok):
+        self.requests += 1
+        if not ok:
+            self.errors += 1
+        self.by_endpoint[endpoint] = self.by_endpoint.get(endpoint, 0) + 1
+        self.latencies.append(latency)
+
+    def snapshot(self, cache):
+        uptime = time.monotonic() - self.started
+        latencies = sorted(self.latencies)
+
+        def percentile(q):
+            if not latencies:
+                return None
+            return round(latencies[min(len(latencies) - 1, int(q * len(latencies)))] * 1000, 3)
+
+        return {
+            'uptime_s': round(uptime, 3),
+            'requests': self.requests,
+            'errors': self.errors,
+            'requests_per_s': round(self.requests / uptime, 3) if uptime else 0.0,
+            'by_endpoint': dict(self.by_endpoint),
+            'latency_ms': {'p50': percentile(0.5), 'p90': percentile(0.9), 'p99': percentile(0.99),
+                           'max': percentile(1.0), 'window': len(latencies)},
+            'cache': {'size': len(cache.entries), 'max_size': cache.max_size,
+                      'hits': cache.hits, 'misses': cache.misses}
+        }
+
+
+class WordService:
+    def __init__(self, word_models, cache_size=1024, related_index=None, top_m=100):
+        self.word_models = word_models
+        self.top_m = top_m
+        # association lists per interval configuration name, built on first use
+        self.related_indexes = {None: related_index} if related_index is not None else {}
+        # pair lookup for /score, built on first use; plain dict models can't keep it themselves
+        self.score_index = None
+        self.cache = LRUCache(cache_size)
+        self.stats = ServiceStats()
+        self.routes = {
+            '/generate': self.generate,
+            '/diffusion': self.diffusion,
+            '/related': self.related,
+            '/score': self.score,
+        }
+
+    def generate(self, params):
+        seeds = normalise_seeds(params.get('seeds'))
+        length = int_param(params, 'length', 20, 1, MAX_LENGTH)
+        intervals = interval_param(self.word_models, params)
+        key = ('generate', seeds, length, intervals)
+
+        def run():
+            words = generate_fibonacci_bidirectional_multi_words_batch(self.word_models, [seeds], length, intervals)[0]
+            return {'seeds': list(seeds), 'length': length, 'intervals': intervals, 'words': words}
+
+        return key, run
+
+    def diffusion(self, params):
+        seeds = normalise_seeds(params.get('seeds'))
+        length = int_param(params, 'length', 20, 1, MAX_LENGTH)
+        steps = int_param(params, 'steps', 3, 1, MAX_DIFFUSION_STEPS)
+        intervals = interval_param(self.word_models, params)
+        key = ('diffusion', seeds, length, steps, intervals)
+
+        def run():
+            words, _ = generate_fibonacci_diffusion_words(
+                self.word_models, list(seeds), length=length, diffusion_steps=steps, verbose=False,
+                analysis=False, intervals=intervals
+            )
+            return {'seeds': list(seeds), 'length': length, 'steps': steps, 'intervals': intervals, 'words': words}
+
+        return key, run
+
+    def related_index(self, intervals=None):
+        related_index = self.related_indexes.get(intervals)
+        if related_index is None:
+            related_index = related_word_index(self.word_models, self.top_m, intervals)
+            self.related_indexes[intervals] = related_index
+        return related_index
+
+    def pair_score_index(self):
+        if self.score_index is None:
+            self.score_index = pair_score_index(self.word_models)
+        return self.score_index
+
+    def related(self, params):
+        seeds = normalise_seeds(params.get('prompt', params.get('seeds')))
+        n = int_param(params, 'n', 10, 1, MAX_LENGTH)
+        hops = int_param(params, 'hops', 2, 1, 10)
+        intervals = interval_param(self.word_models, params)
+        key = ('related', seeds, n, hops, intervals)
+
+        def run():
+            words = expand_related_words(self.related_index(intervals), seeds, n, hops)
+            return {'seeds': list(seeds), 'n': n, 'intervals': intervals, 'words': words}
+
+        return key, run
+
+    def score(self, params):
+        documents = params.get('documents', params.get('text'))
+        if isinstance(documents, str):
+            documents = [documents]
+        if not isinstance(documents, list) or not documents or not all(isinstance(d, str) for d in documents):
+            raise RequestError(400, "'documents' must be a non-empty list of strings")
+        intervals = interval_param(self.word_models, params)
+        # not cached: a key holding every document could pin up to a request body per entry,
+        # and repeated batches are rare enough that rescoring them costs less
+        key = None
+
+        def run():
+            doc_scores, _ = score_documents(self.pair_score_index(), documents, intervals)
+            return {'intervals': intervals, 'scores': doc_scores.tolist()}
+
+        return key, run
+
+    async def dispatch(self, method, target, body):
+        url = urlsplit(target)
+        if url.path == '/stats':
+            return self.stats.snapshot(self.cache)
+        if url.path == '/health':
+            return {'status': 'ok'}
+
+        handler = self.routes.get(url.path)
+        if handler is None:
+            raise RequestError(404, f"unknown endpoint {url.path}")
+        if method == 'GET':
+            params = {name: values[-1] for name, values in parse_qs(url.query).items()}
+            if 'seeds' in params:
+                params['seeds'] = params['seeds'].split(',')
+        elif method == 'POST':
+            try:
+                params = json.loads(body or b'{}')
+            except ValueError:
+                raise RequestError(400, "request body is not valid JSON")
+            if not isinstance(params, dict):
+                raise RequestError(400, "request body must be a JSON object")
+        else:
+            raise RequestError(405, f"method {method} not allowed")
+
+        key, run = handler(params)
+        if key is None:
+            return await asyncio.get_running_loop().run_in_executor(None, run)
+        # Cache the future, not the result, so concurrent identical requests share one computation
+        future = self.cache.get(key)
+        if future is None:
+            future = asyncio.get_running_loop().run_in_executor(None, run)
+            self.cache.put(key, future)
+        try:
+            return await asyncio.shield(future)
+        except Exception:
+            self.cache.discard(key, future)
+            raise
+
+    async def handle_connection(self, reader, writer):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line.strip():
+                    break
+                started = time.perf_counter()
+
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+
+                try:
+                    method, target, version = request_line.decode('latin-1').split()
+                except ValueError:
+                    await self.respond(writer, 400, {'error': "malformed request line"}, False)
+                    break
+                keep_alive = (headers.get('connection', '').lower() != 'close'
+                              and version == 'HTTP/1.1')
+
+                endpoint = urlsplit(target).path
+                try:
+                    length = int(headers.get('content-length', 0))
+                    if length > MAX_BODY_BYTES:
+                        raise RequestError(413, "request body too large")
+                    body = await reader.readexactly(length) if length else b''
+                    status, payload = 200, await self.dispatch(method, target, body)
+                except RequestError as e:
+                    status, payload = e.status, {'error': str(e)}
+                except ValueError:
+                    status, payload = 400, {'error': "invalid Content-Length"}
+                except Exception as e:
+                    status, payload = 500, {'error': f"{type(e).__name__}: {e}"}
+
+                if endpoint in self.routes:
+                    self.stats.record(endpoint, time.perf_counter() - started, status == 200)
+                await self.respond(writer, status, payload, keep_alive)
+                if not keep_alive:
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    async def respond(self, writer, status, payload, keep_alive):
+        body = json.dumps(payload).encode('utf-8')
+        head = (
+            f"HTTP/1.1 {status} {HTTP_REASONS.get(status, '')}\r\n"
+            f"Content-Type: application/json\r\n"
+            f"Content-Length: {len(body)}\r\n"
+            f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n"
+        )
+        writer.write(head.encode('latin-1') + body)
+        await writer.drain()
+
+    async def serve(self, host='127.0.0.1', port=8765):
+        server = await asyncio.start_server(self.handle_connection, host, port)
+        addresses = ', '.join(f"{sock.getsockname()[0]}:{sock.getsockname()[1]}" for sock in server.sockets)
+        print(f"🌐 Serving Fibonacci word suggestions on {addresses}")
+        async with server:
+            await server.serve_forever()
+
+
+def main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Serve Fibonacci word generation over HTTP/JSON")
+    parser.add_argument('--model', default='fibonacci_word_model.bin', help="binary or pickled word model")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--cache-size', type=int, default=1024, help="cached responses (0 disables caching)")
+    parser.add_argument('--top-k', type=int, help="build a top-K candidate index when loading")
+    parser.add_argument('--related-index', help="saved association lists for /related (built at startup otherwise)")
+    parser.add_argument('--top-m', type=int, default=100, help="associated words kept per word for /related")
+    args = parser.parse_args(argv)
+
+    print(f"📂 Loading word model: {args.model}")
+    word_models = load_word_model(args.model, top_k=args.top_k)
+    if args.related_index:
+        related_index = RelatedWordIndex.load(args.related_index)
+    else:
+        print("🔗 Building association lists for /related")
+        related_index = related_word_index(word_models, args.top_m)
+    service = WordService(word_models, cache_size=args.cache_size, related_index=related_index, top_m=args.top_m)
+    try:
+        asyncio.run(service.serve(args.host, args.port))
+    except KeyboardInterrupt:
+        print("\n👋 Service stopped")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,1301 @@
+#!/usr/bin/env python3
+import json
+import mmap
+import os
+import pickle
+import struct
+from array import array
+from bisect import bisect_left
+from collections import Counter
+from collections.abc import Mapping
+
+import numpy as np
+
+
+class TransposedCounts(Mapping):
+    # backward[word][fib_distance][partner] == forward[partner][fib_distance][word]
+    __slots__ = ('_forward_model', '_word', '_fib_distance', '_partners', '_total')
+
+    def __init__(self, forward_model, word, fib_distance, partners, total):
+        self._forward_model = forward_model
+        self._word = word
+        self._fib_distance = fib_distance
+        self._partners = partners
+        self._total = total
+
+    def __getitem__(self, partner):
+        row = self._forward_model.get(partner, {}).get(self._fib_distance)
+        if row is None:
+            return 0
+        return row.get(self._word, 0)
+
+    def __contains__(self, partner):
+        row = self._forward_model.get(partner, {}).get(self._fib_distance)
+        return row is not None and self._word in row
+
+    def __iter__(self):
+        return iter(self._partners)
+
+    def __len__(self):
+        return len(self._partners)
+
+    def get(self, partner, default=None):
+        return self[partner] if partner in self else default
+
+    def total(self):
+        return self._total
+
+
+class TransposedDistances(Mapping):
+    __slots__ = ('_model', '_word', '_word_id', '_fib_distances')
+
+    def __init__(self, model, word, word_id):
+        self._model = model
+        self._word = word
+        self._word_id = word_id
+        self._fib_distances = [
+            fib_distance for fib_distance in model.fib_distances
+            if model.transposed_row_bounds(fib_distance, word_id) is not None
+        ]
+
+    def __getitem__(self, fib_distance):
+        model = self._model
+        bounds = model.transposed_row_bounds(fib_distance, self._word_id)
+        if bounds is None:
+            raise KeyError(fib_distance)
+        words = model.words
+        partners = tuple(words[partner] for partner in model.transposed[fib_distance][1][bounds[0]:bounds[1]])
+        return TransposedCounts(model.forward_model, self._word, fib_distance, partners,
+                                model.totals[fib_distance][1][self._word_id])
+
+    def __contains__(self, fib_distance):
+        return fib_distance in self._fib_distances
+
+    def __iter__(self):
+        return iter(self._fib_distances)
+
+    def __len__(self):
+        return len(self._fib_distances)
+
+
+class TransposedWordModel(Mapping):
+    def __init__(self, model):
+        self._model = model
+
+    def __getitem__(self, word):
+        return TransposedDistances(self._model, word, self._model.backward_words[word])
+
+    def __contains__(self, word):
+        return word in self._model.backward_words
+
+    def __iter__(self):
+        return iter(self._model.backward_words)
+
+    def __len__(self):
+        return len(self._model.backward_words)
+
+
+def _typed_array(typecode, dtype, values):
+    if isinstance(values, array) and values.typecode == typecode:
+        return values
+    if isinstance(values, np.ndarray):
+        return array(typecode, values.astype(dtype).tobytes())
+    return array(typecode, values)
+
+
+def _id_array(values=()):
+    return _typed_array('i', np.int32, values)
+
+
+def _total_array(values=()):
+    return _typed_array('q', np.int64, values)
+
+
+class SharedWordModel(Mapping):
+    # One canonical copy of the counts (the forward rows). The backward model is a
+    # transposed index that reads its counts from the same rows. The index and the row
+    # totals are flat arrays keyed by word id (4 bytes per pair, 8 per word and distance),
+    # so the model costs little more than its forward rows.
+    def __init__(self, forward_model, words, backward_words, transposed, totals, interval_configs=None):
+        # words: every word, by id. backward_words: {word: id} for the words with backward
+        # rows, in backward iteration order. transposed: {distance: (indptr, partner ids)}
+        # with each row's partners in first-occurrence order. totals: {distance: (forward
+        # totals, backward totals)} by word id. Arrays are array.array or anything
+        # array.array accepts.
+        self.forward_model = forward_model
+        self.words = list(words)
+        self.ids = {word: word_id for word_id, word in enumerate(self.words)}
+        self.backward_words = backward_words
+        self.fib_distances = sorted(transposed)
+        self.transposed = {
+            fib_distance: (_total_array(indptr), _id_array(partners))
+            for fib_distance, (indptr, partners) in transposed.items()
+        }
+        self.totals = {
+            fib_distance: (_total_array(forward), _total_array(backward))
+            for fib_distance, (forward, backward) in totals.items()
+        }
+        self.backward_model = TransposedWordModel(self)
+        self.interval_configs = interval_configs or {}
+
+    @classmethod
+    def from_transposed_index(cls, forward_model, transposed_index, interval_configs=None):
+        # transposed_index: {word: {distance: partner words}}, the layout of earlier versions
+        words = {}
+        for word, rows in forward_model.items():
+            words.setdefault(word, len(words))
+            for row in rows.values():
+                for partner in row:
+                    words.setdefault(partner, len(words))
+        for word in transposed_index:
+            words.setdefault(word, len(words))
+        
+        rows, partners = {}, {}
+        for word, word_rows in transposed_index.items():
+            for fib_distance, row in word_rows.items():
+                rows.setdefault(fib_distance, []).extend([words[word]] * len(row))
+                partners.setdefault(fib_distance, []).extend(words[partner] for partner in row)
+        transposed = {}
+        for fib_distance in rows:
+            row_ids = np.array(rows[fib_distance], dtype=np.int64)
+            transposed[fib_distance] = (
+                _csr_indptr(row_ids, len(words)),
+                np.array(partners[fib_distance], dtype=np.int64)[stable_group_order(row_ids)]
+            )
+        
+        totals = {fib_distance: ([0] * len(words), [0] * len(words)) for fib_distance in transposed}
+        for word, word_rows in forward_model.items():
+            for fib_distance, row in word_rows.items():
+                forward, backward = totals[fib_distance]
+                for partner, count in row.items():
+                    forward[words[word]] += count
+                    backward[words[partner]] += count
+        backward_words = {word: words[word] for word in transposed_index}
+        return cls(forward_model, list(words), backward_words, transposed, totals, interval_configs)
+
+    @classmethod
+    def from_word_models(cls, word_models):
+        transposed_index = {
+            word: {fib_distance: tuple(row) for fib_distance, row in rows.items()}
+            for word, rows in word_models['backward'].items()
+        }
+        return cls.from_transposed_index(word_models['forward'], transposed_index)
+
+    def __getitem__(self, key):
+        if key == 'forward':
+            return self.forward_model
+        if key == 'backward':
+            return self.backward_model
+        raise KeyError(key)
+
+    def __iter__(self):
+        return iter(('forward', 'backward'))
+
+    def __len__(self):
+        return 2
+
+    def __getstate__(self):
+        return {
+            'forward_model': self.forward_model, 'words': self.words, 'backward_words': self.backward_words,
+            'transposed': self.transposed, 'totals': self.totals, 'interval_configs': self.interval_configs,
+        }
+
+    def __setstate__(self, state):
+        self.__init__(**state)
+
+    def transposed_row_bounds(self, fib_distance, word_id):
+        # (start, end) of a word's partners at fib_distance, None if it has none; an index
+        # rebuilt before a word was added is shorter than the vocabulary
+        table = self.transposed.get(fib_distance)
+        if table is None or word_id >= len(table[0]) - 1:
+            return None
+        start, end = table[0][word_id], table[0][word_id + 1]
+        return (start, end) if end > start else None
+
+    def _word_id(self, word):
+        word_id = self.ids.get(word)
+        if word_id is None:
+            word_id = self.ids[word] = len(self.words)
+            self.words.append(word)
+            for forward, backward in self.totals.values():
+                forward.append(0)
+                backward.append(0)
+        return word_id
+
+    def add_pairs(self, fib_distance, left_words, right_words, counts):
+        # Pairs must come in first-occurrence order; new partners are appended to rows
+        # exactly where retraining over the extended corpus would put them.
+        self.__dict__.pop('_pair_score_index', None)
+        forward_model = self.forward_model
+        if fib_distance not in self.totals:
+            self.totals[fib_distance] = (_total_array([0] * len(self.words)), _total_array([0] * len(self.words)))
+            self.transposed[fib_distance] = (_total_array([0]), _id_array())
+            self.fib_distances = sorted(self.transposed)
+        new_rows, new_partners = [], []
+        for left, right, count in zip(left_words, right_words, counts):
+            rows = forward_model.setdefault(left, {})
+            row = rows.get(fib_distance)
+            if row is None:
+                row = rows[fib_distance] = Counter()
+            left_id = self._word_id(left)
+            right_id = self._word_id(right)
+            if right not in row:
+                new_rows.append(right_id)
+                new_partners.append(left_id)
+                self.backward_words.setdefault(right, right_id)
+            row[right] += count
+            forward_totals, backward_totals = self.totals[fib_distance]
+            forward_totals[left_id] += count
+            backward_totals[right_id] += count
+        
+        # rows are rebuilt with the new partners after the old ones, in the order they came
+        indptr, partners = self.transposed[fib_distance]
+        indptr = np.frombuffer(indptr, dtype=np.int64)
+        old_rows = np.repeat(np.arange(len(indptr) - 1, dtype=np.int64), np.diff(indptr))
+        row_ids = np.concatenate((old_rows, np.array(new_rows, dtype=np.int64)))
+        order = stable_group_order(row_ids)
+        self.transposed[fib_distance] = (
+            _total_array(_csr_indptr(row_ids, len(self.words))),
+            _id_array(np.concatenate((np.frombuffer(partners, dtype=np.int32),
+                                      np.array(new_partners, dtype=np.int32)))[order])
+        )
+
+    def mutual_candidates(self, start_word, fib_distance, direction):
+        # Both probabilities of a pair share one count, so no per-candidate lookups are needed.
+        candidates = []
+        if fib_distance not in self.totals:
+            return candidates
+        forward_totals, backward_totals = self.totals[fib_distance]
+        if direction > 0:
+            row = self.forward_model.get(start_word, {}).get(fib_distance)
+            if not row:
+                return candidates
+            total = forward_totals[self.ids[start_word]]
+            ids = self.ids
+            for word, count in row.items():
+                forward_prob = count / total
+                backward_prob = count / backward_totals[ids[word]]
+                candidates.append((word, forward_prob, backward_prob, forward_prob * backward_prob))
+        else:
+            word_id = self.backward_words.get(start_word)
+            bounds = None if word_id is None else self.transposed_row_bounds(fib_distance, word_id)
+            if bounds is None:
+                return candidates
+            total = backward_totals[word_id]
+            words = self.words
+            forward_model = self.forward_model
+            for partner in self.transposed[fib_distance][1][bounds[0]:bounds[1]]:
+                word = words[partner]
+                count = forward_model[word][fib_distance][start_word]
+                forward_prob = count / forward_totals[partner]
+                backward_prob = count / total
+                candidates.append((word, forward_prob, backward_prob, forward_prob * backward_prob))
+        return candidates
+
+
+BINARY_MAGIC = b'FIBWORD\0'
+BINARY_FORMAT_VERSION = 1
+BINARY_ALIGNMENT = 64
+
+
+def stable_group_order(keys):
+    # positions in the low bits make the default sort stable, and sorting those values and
+    # masking the positions back out is several times faster than any argsort
+    return np.sort((keys.astype(np.int64) << 32) | np.arange(len(keys))) & 0xFFFFFFFF
+
+
+def _smallest_dtype(max_value, candidates):
+    for dtype in candidates:
+        if max_value <= np.iinfo(dtype).max:
+            return np.dtype(dtype)
+    raise ValueError(f"Value {max_value} does not fit in any of {candidates}")
+
+
+def _csr_indptr(row_ids, vocab_size):
+    indptr = np.zeros(vocab_size + 1, dtype=np.int64)
+    np.cumsum(np.bincount(row_ids, minlength=vocab_size), out=indptr[1:])
+    return indptr
+
+
+def _row_totals(indptr, counts):
+    totals = np.zeros(len(indptr) - 1, dtype=np.uint64)
+    non_empty = indptr[1:] > indptr[:-1]
+    if non_empty.any():
+        totals[non_empty] = np.add.reduceat(counts, indptr[:-1][non_empty])
+    return totals
+
+
+def build_distance_arrays(vocab_size, forward_left, forward_right, forward_counts,
+                          backward_rows, backward_partners, backward_counts=None):
+    # Forward rows keep the order of (forward_left, forward_right); backward rows keep the order
+    # of (backward_rows, backward_partners) and point into the forward counts instead of copying them.
+    forward_left = np.asarray(forward_left, dtype=np.int64)
+    forward_right = np.asarray(forward_right, dtype=np.int64)
+    forward_counts = np.asarray(forward_counts, dtype=np.int64)
+    backward_rows = np.asarray(backward_rows, dtype=np.int64)
+    backward_partners = np.asarray(backward_partners, dtype=np.int64)
+    
+    id_dtype = _smallest_dtype(max(vocab_size - 1, 0), (np.int32, np.int64))
+    count_dtype = _smallest_dtype(int(forward_counts.max(initial=0)), (np.uint32, np.uint64))
+    slot_dtype = _smallest_dtype(len(forward_counts), (np.int32, np.int64))
+    
+    order = stable_group_order(forward_left)
+    forward_left = forward_left[order]
+    forward_right = forward_right[order]
+    counts = forward_counts[order]
+    
+    pair_codes = (forward_left << 32) | forward_right
+    code_order = np.argsort(pair_codes)
+    sorted_codes = pair_codes[code_order]
+    
+    backward_order = stable_group_order(backward_rows)
+    backward_rows = backward_rows[backward_order]
+    backward_partners = backward_partners[backward_order]
+    wanted = (backward_partners << 32) | backward_rows
+    found = np.searchsorted(sorted_codes, wanted)
+    found[found == len(sorted_codes)] = 0
+    if len(wanted) != len(pair_codes) or not np.array_equal(sorted_codes[found], wanted):
+        raise ValueError("Backward model is not the transpose of the forward model")
+    slots = code_order[found]
+    if backward_counts is not None:
+        backward_counts = np.asarray(backward_counts, dtype=np.int64)[backward_order]
+        if not np.array_equal(counts[slots], backward_counts):
+            raise ValueError("Backward counts disagree with forward counts")
+    
+    forward_indptr = _csr_indptr(forward_left, vocab_size)
+    backward_indptr = _csr_indptr(backward_rows, vocab_size)
+    return {
+        'forward_indptr': forward_indptr,
+        'forward_partners': forward_right.astype(id_dtype),
+        'counts': counts.astype(count_dtype),
+        'forward_totals': _row_totals(forward_indptr, counts),
+        'backward_indptr': backward_indptr,
+        'backward_partners': backward_partners.astype(id_dtype),
+        'backward_slots': slots.astype(slot_dtype),
+        'backward_totals': _row_totals(backward_indptr, counts[slots]),
+    }
+
+
+def pair_code_arrays(forward_indptr, forward_partners):
+    # Every forward entry as a sorted (row << 32 | partner) code and the entry's slot, so
+    # arbitrary pairs can be looked up with one searchsorted instead of a row scan
+    rows = np.repeat(np.arange(len(forward_indptr) - 1, dtype=np.int64), np.diff(forward_indptr))
+    codes = (rows << 32) | forward_partners.astype(np.int64)
+    order = np.argsort(codes)
+    return {
+        'pair_codes': codes[order],
+        'pair_slots': order.astype(_smallest_dtype(len(order), (np.int32, np.int64))),
+    }
+
+
+def entry_scores(arrays, direction):
+    # forward_prob * backward_prob for every entry of one distance's CSR rows, computed
+    # exactly as mutual_candidates computes them
+    indptr = arrays[f'{direction}_indptr']
+    rows = np.repeat(np.arange(len(indptr) - 1), np.diff(indptr))
+    partners = arrays[f'{direction}_partners']
+    if direction == 'forward':
+        counts = arrays['counts']
+        forward_probs = counts / arrays['forward_totals'][rows]
+        backward_probs = counts / arrays['backward_totals'][partners]
+    else:
+        counts = arrays['counts'][arrays['backward_slots']]
+        forward_probs = counts / arrays['forward_totals'][partners]
+        backward_probs = counts / arrays['backward_totals'][rows]
+    return indptr, rows, forward_probs * backward_probs
+
+
+def ranked_index_arrays(arrays, top_k):
+    # Per row, the positions of its top_k entries by combined score. lexsort is stable,
+    # so ties keep row order, the same tie-break as sorting the candidate list.
+    ranked = {}
+    for direction in ('forward', 'backward'):
+        indptr, rows, scores = entry_scores(arrays, direction)
+        order = np.lexsort((-scores, rows))
+        keep = (np.arange(len(order)) - indptr[rows]) < top_k
+        ranked_indptr = np.zeros(len(indptr), dtype=np.int64)
+        np.cumsum(np.minimum(np.diff(indptr), top_k), out=ranked_indptr[1:])
+        ranked[f'ranked_{direction}_indptr'] = ranked_indptr
+        ranked[f'ranked_{direction}_positions'] = order[keep].astype(
+            _smallest_dtype(len(order), (np.int32, np.int64))
+        )
+    return ranked
+
+
+def write_word_model_binary(path, vocab_words, forward_words, backward_words, distance_arrays, top_k=None,
+                            interval_configs=None, pair_codes=False):
+    # pair_codes also stores pair_code_arrays, so scoring reads its lookup from the mapping
+    # instead of building one in memory; it makes the file noticeably larger
+    encoded = [word.encode('utf-8') for word in vocab_words]
+    vocab_offsets = np.zeros(len(encoded) + 1, dtype=np.uint64)
+    np.cumsum([len(word) for word in encoded], out=vocab_offsets[1:])
+    
+    arrays = {
+        'vocab_offsets': vocab_offsets,
+        'vocab_bytes': np.frombuffer(b''.join(encoded), dtype=np.uint8),
+        'vocab_sorted': np.array(sorted(range(len(encoded)), key=encoded.__getitem__), dtype=np.int64),
+        'forward_words': np.asarray(forward_words, dtype=np.int64),
+        'backward_words': np.asarray(backward_words, dtype=np.int64),
+    }
+    for fib_distance, named_arrays in distance_arrays.items():
+        if pair_codes and 'pair_codes' not in named_arrays:
+            named_arrays = {**named_arrays,
+                            **pair_code_arrays(named_arrays['forward_indptr'], named_arrays['forward_partners'])}
+        if top_k:
+            named_arrays = {**named_arrays, **ranked_index_arrays(named_arrays, top_k)}
+        for name, array in named_arrays.items():
+            arrays[f'{name}_{fib_distance}'] = array
+    
+    layout = {}
+    offset = 0
+    for name, array in arrays.items():
+        offset = -(-offset // BINARY_ALIGNMENT) * BINARY_ALIGNMENT
+        layout[name] = {'offset': offset, 'dtype': array.dtype.str, 'count': len(array)}
+        offset += array.nbytes
+    
+    header = json.dumps({
+        'version': BINARY_FORMAT_VERSION,
+        'vocab_size': len(encoded),
+        'fib_distances': sorted(distance_arrays),
+        'top_k': top_k or None,
+        'intervals': interval_configs or {},
+        'arrays': layout,
+    }).encode('utf-8')
+    prefix_size = len(BINARY_MAGIC) + 8 + len(header)
+    data_start = -(-prefix_size // BINARY_ALIGNMENT) * BINARY_ALIGNMENT
+    
+    # write beside the target and swap it in, so processes mapping the old file keep working
+    temp_path = f'{path}.tmp'
+    with open(temp_path, 'wb') as f:
+        f.write(BINARY_MAGIC)
+        f.write(struct.pack('<II', BINARY_FORMAT_VERSION, len(header)))
+        f.write(header)
+        for name, array in arrays.items():
+            f.write(b'\0' * (data_start + layout[name]['offset'] - f.tell()))
+            f.write(np.ascontiguousarray(array).tobytes())
+    os.replace(temp_path, path)
+
+
+def save_word_model_binary(word_models, path, top_k=None, pair_codes=False):
+    # Generic writer for anything exposing word_models['forward'] / ['backward'] mappings.
+    forward_model = word_models['forward']
+    backward_model = word_models['backward']
+    vocab = {}
+    for model in (forward_model, backward_model):
+        for word, rows in model.items():
+            vocab.setdefault(word, len(vocab))
+            for row in rows.values():
+                for partner in row:
+                    vocab.setdefault(partner, len(vocab))
+    
+    tables = {}
+    for model, side in ((forward_model, 0), (backward_model, 1)):
+        for word, rows in model.items():
+            word_id = vocab[word]
+            for fib_distance, row in rows.items():
+                table = tables.setdefault(fib_distance, ([], [], [], [], [], []))
+                for partner, count in row.items():
+                    table[3 * side].append(word_id)
+                    table[3 * side + 1].append(vocab[partner])
+                    table[3 * side + 2].append(count)
+    
+    distance_arrays = {}
+    for fib_distance in sorted(tables):
+        left, right, counts, rows, partners, backward_counts = tables[fib_distance]
+        distance_arrays[fib_distance] = build_distance_arrays(
+            len(vocab), left, right, counts, rows, partners, backward_counts
+        )
+    
+    write_word_model_binary(
+        path, list(vocab),
+        [vocab[word] for word in forward_model], [vocab[word] for word in backward_model],
+        distance_arrays, top_k=top_k, interval_configs=getattr(word_models, 'interval_configs', None),
+        pair_codes=pair_codes
+    )
+
+
+class MappedVocab:
+    # Words are decoded from the mapping on first use and cached, so a process only
+    # pays for the part of the vocabulary it actually touches.
+    def __init__(self, offsets, data, sorted_ids):
+        self._offsets = offsets
+        self._data = data
+        self._sorted_ids = sorted_ids
+        self._sorted_view = _SortedVocabView(self)
+        self._words = {}
+        self._ids = {}
+
+    def __len__(self):
+        return len(self._offsets) - 1
+
+    def word_bytes(self, word_id):
+        return self._data[self._offsets[word_id]:self._offsets[word_id + 1]].tobytes()
+
+    def word(self, word_id):
+        word = self._words.get(word_id)
+        if word is None:
+            word = self._words[word_id] = self.word_bytes(word_id).decode('utf-8')
+        return word
+
+    def words(self, word_ids):
+        cache = self._words
+        return [cache[i] if i in cache else self.word(i) for i in word_ids]
+
+    def id_of(self, word):
+        if word in self._ids:
+            return self._ids[word]
+        key = word.encode('utf-8')
+        position = bisect_left(self._sorted_view, key)
+        if position < len(self) and self._sorted_view[position] == key:
+            word_id = self._ids[word] = int(self._sorted_ids[position])
+            return word_id
+        return None
+
+
+class _SortedVocabView:
+    def __init__(self, vocab):
+        self._vocab = vocab
+
+    def __len__(self):
+        return len(self._vocab)
+
+    def __getitem__(self, position):
+        return self._vocab.word_bytes(self._vocab._sorted_ids[position])
+
+
+class MappedCounts(Mapping):
+    __slots__ = ('_vocab', '_partners', '_counts', '_total')
+
+    def __init__(self, vocab, partners, counts, total):
+        self._vocab = vocab
+        self._partners = partners
+        self._counts = counts
+        self._total = total
+
+    def __getitem__(self, partner):
+        partner_id = self._vocab.id_of(partner)
+        if partner_id is None:
+            return 0
+        hits = np.flatnonzero(self._partners == partner_id)
+        return int(self._counts[hits[0]]) if len(hits) else 0
+
+    def __contains__(self, partner):
+        partner_id = self._vocab.id_of(partner)
+        return partner_id is not None and bool((self._partners == partner_id).any())
+
+    def __iter__(self):
+        return iter(self._vocab.words(self._partners.tolist()))
+
+    def __len__(self):
+        return len(self._partners)
+
+    def get(self, partner, default=None):
+        return self[partner] if partner in self else default
+
+    def items(self):
+        return list(zip(self._vocab.words(self._partners.tolist()), self._counts.tolist()))
+
+    def values(self):
+        return self._counts.tolist()
+
+    def total(self):
+        return self._total
+
+
+class MappedDistances(Mapping):
+    __slots__ = ('_model', '_direction', '_word_id')
+
+    def __init__(self, model, direction, word_id):
+        self._model = model
+        self._direction = direction
+        self._word_id = word_id
+
+    def __getitem__(self, fib_distance):
+        row = self._model.row(self._direction, self._word_id, fib_distance)
+        if row is None:
+            raise KeyError(fib_distance)
+        partners, counts, total = row
+        return MappedCounts(self._model.vocab, partners, counts, total)
+
+    def __contains__(self, fib_distance):
+        return self._model.row_length(self._direction, self._word_id, fib_distance) > 0
+
+    def __iter__(self):
+        return (d for d in self._model.fib_distances if d in self)
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+
+class MappedDirection(Mapping):
+    def __init__(self, model, direction):
+        self._model = model
+        self._direction = direction
+
+    def __getitem__(self, word):
+        word_id = self._model.vocab.id_of(word)
+        if word_id is None or not self._model.has_rows(self._direction, word_id):
+            raise KeyError(word)
+        return MappedDistances(self._model, self._direction, word_id)
+
+    def __contains__(self, word):
+        word_id = self._model.vocab.id_of(word)
+        return word_id is not None and self._model.has_rows(self._direction, word_id)
+
+    def __iter__(self):
+        word_ids = self._model.array(f'{self._direction}_words')
+        return iter(self._model.vocab.words(word_ids.tolist()))
+
+    def __len__(self):
+        return len(self._model.array(f'{self._direction}_words'))
+
+
+class MappedWordModel(Mapping):
+    # Read-only word model backed by one mmap of the binary file; arrays are never copied.
+    def __init__(self, path, top_k=None):
+        self.path = path
+        self._file = open(path, 'rb')
+        self._buffer = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        
+        if self._buffer[:len(BINARY_MAGIC)] != BINARY_MAGIC:
+            raise ValueError(f"{path} is not a binary Fibonacci word model")
+        version, header_size = struct.unpack_from('<II', self._buffer, len(BINARY_MAGIC))
+        if version > BINARY_FORMAT_VERSION:
+            raise ValueError(f"{path} uses format version {version}; this code reads up to {BINARY_FORMAT_VERSION}")
+        header_start = len(BINARY_MAGIC) + 8
+        self.header = json.loads(self._buffer[header_start:header_start + header_size].decode('utf-8'))
+        data_start = -(-(header_start + header_size) // BINARY_ALIGNMENT) * BINARY_ALIGNMENT
+        
+        self._arrays = {
+            name: np.frombuffer(self._buffer, dtype=spec['dtype'], count=spec['count'],
+                                offset=data_start + spec['offset'])
+            for name, spec in self.header['arrays'].items()
+        }
+        self.fib_distances = self.header['fib_distances']
+        self.top_k = self.header.get('top_k')
+        # JSON keys are strings; per-distance weights are keyed by int distance in memory
+        self.interval_configs = {
+            name: {'distances': config['distances'],
+                   'weights': {int(d): weight for d, weight in config['weights'].items()}}
+            for name, config in self.header.get('intervals', {}).items()
+        }
+        self.vocab = MappedVocab(self.array('vocab_offsets'), self.array('vocab_bytes'), self.array('vocab_sorted'))
+        self.forward_model = MappedDirection(self, 'forward')
+        self.backward_model = MappedDirection(self, 'backward')
+        if top_k and top_k != self.top_k:
+            self.build_ranked_index(top_k)
+
+    def __reduce__(self):
+        return (MappedWordModel, (self.path, self.top_k))
+
+    def distance_arrays(self, fib_distance):
+        suffix = f'_{fib_distance}'
+        return {
+            name[:-len(suffix)]: array for name, array in self._arrays.items()
+            if name.endswith(suffix) and not name.startswith('ranked_')
+        }
+
+    def build_ranked_index(self, top_k):
+        # in memory, for files written without an index (or with a different top_k)
+        for fib_distance in self.fib_distances:
+            for name, array in ranked_index_arrays(self.distance_arrays(fib_distance), top_k).items():
+                self._arrays[f'{name}_{fib_distance}'] = array
+        self.top_k = top_k
+
+    def close(self):
+        self._arrays = {}
+        self.vocab = None
+        try:
+            self._buffer.close()
+        except BufferError:
+            # rows handed out earlier still reference the mapping; it is released with them
+            pass
+        self._file.close()
+
+    def array(self, name):
+        return self._arrays[name]
+
+    def has_pair_codes(self):
+        return all(f'pair_codes_{fib_distance}' in self._arrays for fib_distance in self.fib_distances)
+
+    def __getitem__(self, key):
+        if key == 'forward':
+            return self.forward_model
+        if key == 'backward':
+            return self.backward_model
+        raise KeyError(key)
+
+    def __iter__(self):
+        return iter(('forward', 'backward'))
+
+    def __len__(self):
+        return 2
+
+    def row_bounds(self, direction, word_id, fib_distance):
+        if f'{direction}_indptr_{fib_distance}' not in self._arrays:
+            return 0, 0
+        indptr = self._arrays[f'{direction}_indptr_{fib_distance}']
+        return int(indptr[word_id]), int(indptr[word_id + 1])
+
+    def row_length(self, direction, word_id, fib_distance):
+        start, end = self.row_bounds(direction, word_id, fib_distance)
+        return end - start
+
+    def has_rows(self, direction, word_id):
+        return any(self.row_length(direction, word_id, d) for d in self.fib_distances)
+
+    def row(self, direction, word_id, fib_distance):
+        start, end = self.row_bounds(direction, word_id, fib_distance)
+        if start == end:
+            return None
+        arrays = self._arrays
+        partners = arrays[f'{direction}_partners_{fib_distance}'][start:end]
+        if direction == 'forward':
+            counts = arrays[f'counts_{fib_distance}'][start:end]
+        else:
+            counts = arrays[f'counts_{fib_distance}'][arrays[f'backward_slots_{fib_distance}'][start:end]]
+        total = int(arrays[f'{direction}_totals_{fib_distance}'][word_id])
+        return partners, counts, total
+
+    def _candidate_tuples(self, side, word_id, fib_distance, positions):
+        partners = self._arrays[f'{side}_partners_{fib_distance}'][positions]
+        forward_probs, backward_probs, combined = self._entry_products(side, fib_distance, word_id, positions)
+        return list(zip(
+            self.vocab.words(partners.tolist()),
+            forward_probs.tolist(), backward_probs.tolist(), combined.tolist()
+        ))
+
+    def mutual_candidates(self, start_word, fib_distance, direction):
+        word_id = self.vocab.id_of(start_word)
+        if word_id is None:
+            return []
+        side = 'forward' if direction > 0 else 'backward'
+        start, end = self.row_bounds(side, word_id, fib_distance)
+        if start == end:
+            return []
+        return self._candidate_tuples(side, word_id, fib_distance, slice(start, end))
+
+    def best_mutual_candidates(self, requests):
+        # Best candidate for many (word, distance, direction) requests at once: rows of the
+        # same distance and side are scored together and reduced with a segmented argmax
+        # (first maximum in row order, the candidate a stable descending sort puts first).
+        best = [None] * len(requests)
+        groups = {}
+        for index, (word, fib_distance, direction) in enumerate(requests):
+            word_id = self.vocab.id_of(word)
+            if word_id is not None and f'forward_indptr_{fib_distance}' in self._arrays:
+                side = 'forward' if direction > 0 else 'backward'
+                groups.setdefault((side, fib_distance), ([], []))
+                groups[(side, fib_distance)][0].append(index)
+                groups[(side, fib_distance)][1].append(word_id)
+        
+        for (side, fib_distance), (indices, word_ids) in groups.items():
+            word_ids = np.array(word_ids, dtype=np.int64)
+            if self.top_k:
+                indptr = self._arrays[f'ranked_{side}_indptr_{fib_distance}']
+                starts = indptr[word_ids]
+                found = indptr[word_ids + 1] > starts
+                positions = self._arrays[f'ranked_{side}_positions_{fib_distance}'][starts[found]]
+            else:
+                indptr = self._arrays[f'{side}_indptr_{fib_distance}']
+                starts = indptr[word_ids]
+                lengths = indptr[word_ids + 1] - starts
+                found = lengths > 0
+                starts, lengths = starts[found], lengths[found]
+                segment_starts = np.cumsum(lengths) - lengths
+                entries = np.arange(lengths.sum()) - np.repeat(segment_starts - starts, lengths)
+                segments = np.repeat(np.arange(len(lengths)), lengths)
+                rows = np.repeat(word_ids[found], lengths)
+                scores = self._entry_products(side, fib_distance, rows, entries)[2]
+                positions = entries[np.lexsort((-scores, segments))[segment_starts]]
+            
+            rows = word_ids[found]
+            forward_probs, backward_probs, combined = self._entry_products(side, fib_distance, rows, positions)
+            partners = self._arrays[f'{side}_partners_{fib_distance}'][positions]
+            for index, candidate in zip(
+                np.array(indices)[found].tolist(),
+                zip(self.vocab.words(partners.tolist()), forward_probs.tolist(),
+                    backward_probs.tolist(), combined.tolist())
+            ):
+                best[index] = candidate
+        return best
+
+    def _entry_products(self, side, fib_distance, rows, positions):
+        arrays = self._arrays
+        partners = arrays[f'{side}_partners_{fib_distance}'][positions]
+        counts = arrays[f'counts_{fib_distance}']
+        if side == 'forward':
+            counts = counts[positions]
+            forward_probs = counts / arrays[f'forward_totals_{fib_distance}'][rows]
+            backward_probs = counts / arrays[f'backward_totals_{fib_distance}'][partners]
+        else:
+            counts = counts[arrays[f'backward_slots_{fib_distance}'][positions]]
+            forward_probs = counts / arrays[f'forward_totals_{fib_distance}'][partners]
+            backward_probs = counts / arrays[f'backward_totals_{fib_distance}'][rows]
+        return forward_probs, backward_probs, forward_probs * backward_probs
+
+    def ranked_candidates(self, start_word, fib_distance, direction):
+        if not self.top_k:
+            return None
+        word_id = self.vocab.id_of(start_word)
+        side = 'forward' if direction > 0 else 'backward'
+        indptr = self._arrays.get(f'ranked_{side}_indptr_{fib_distance}')
+        if word_id is None or indptr is None or indptr[word_id] == indptr[word_id + 1]:
+            return []
+        positions = self._arrays[f'ranked_{side}_positions_{fib_distance}'][indptr[word_id]:indptr[word_id + 1]]
+        return self._candidate_tuples(side, word_id, fib_distance, positions)
+
+
+class RankedWordModel(Mapping):
+    # Wraps an in-memory word model with precomputed top_k candidate lists per
+    # (word, distance, direction); anything else is delegated to the wrapped model.
+    def __init__(self, word_models, ranked, top_k):
+        self.base = word_models
+        self.ranked = ranked
+        self.top_k = top_k
+
+    def __getattr__(self, name):
+        if name.startswith('__') or name in ('base', 'ranked', 'top_k'):
+            raise AttributeError(name)
+        return getattr(self.base, name)
+
+    def __getitem__(self, key):
+        return self.base[key]
+
+    def __iter__(self):
+        return iter(self.base)
+
+    def __len__(self):
+        return len(self.base)
+
+    def ranked_candidates(self, start_word, fib_distance, direction):
+        return list(self.ranked.get((start_word, fib_distance, direction), ()))
+
+
+def score_mutual_candidates(word_models, start_word, fib_dist, direction):
+    scorer = getattr(word_models, 'mutual_candidates', None)
+    if scorer is not None:
+        return scorer(start_word, fib_dist, direction)
+    
+    if direction > 0:
+        source_model, partner_model = word_models['forward'], word_models['backward']
+    else:
+        source_model, partner_model = word_models['backward'], word_models['forward']
+    
+    candidates = []
+    if start_word in source_model and fib_dist in source_model[start_word]:
+        counts = source_model[start_word][fib_dist]
+        total = sum(counts.values())
+        for candidate_word, count in counts.items():
+            source_prob = count / total
+            partner_prob = 0.0
+            if candidate_word in partner_model and fib_dist in partner_model[candidate_word]:
+                partner_counts = partner_model[candidate_word][fib_dist]
+                partner_total = sum(partner_counts.values())
+                if start_word in partner_counts:
+                    partner_prob = partner_counts[start_word] / partner_total
+            
+            if partner_prob > 0:
+                if direction > 0:
+                    forward_prob, backward_prob = source_prob, partner_prob
+                else:
+                    forward_prob, backward_prob = partner_prob, source_prob
+                candidates.append((candidate_word, forward_prob, backward_prob, forward_prob * backward_prob))
+    
+    return candidates
+
+
+def build_ranked_candidate_index(word_models, top_k=50):
+    if isinstance(word_models, MappedWordModel):
+        word_models.build_ranked_index(top_k)
+        return word_models
+    
+    ranked = {}
+    for direction, model in ((1, word_models['forward']), (-1, word_models['backward'])):
+        for word, rows in model.items():
+            for fib_distance in rows:
+                candidates = score_mutual_candidates(word_models, word, fib_distance, direction)
+                if candidates:
+                    candidates.sort(key=lambda x: x[3], reverse=True)
+                    ranked[(word, fib_distance, direction)] = tuple(candidates[:top_k])
+    return RankedWordModel(word_models, ranked, top_k)
+
+
+class PairScoreIndex:
+    # Per distance, every (left, right) pair as a sorted int64 code with its count and both row
+    # totals, so the mutual score of arbitrary token pairs is one searchsorted per distance.
+    def __init__(self, tables, vocab_size, word_ids=None, resolve_word=None, id_words=None, interval_configs=None):
+        self.tables = tables
+        self.vocab_size = vocab_size
+        self.fib_distances = sorted(tables)
+        self.interval_configs = interval_configs or {}
+        self._ids = word_ids if word_ids is not None else {}
+        self._resolve_word = resolve_word
+        self._id_words = id_words
+        self._word_list = list(word_ids) if word_ids is not None else None
+
+    @classmethod
+    def from_mapped_model(cls, model):
+        # Tables read the mapping itself when the file was written with pair_codes: codes
+        # are sorted at write time, and the slots point each one at its count. Other files
+        # get them built in memory.
+        tables = {}
+        for fib_distance in model.fib_distances:
+            arrays = model.distance_arrays(fib_distance)
+            if 'pair_codes' not in arrays:
+                arrays.update(pair_code_arrays(arrays['forward_indptr'], arrays['forward_partners']))
+            tables[fib_distance] = (
+                arrays['pair_codes'], arrays['counts'], arrays['forward_totals'], arrays['backward_totals'],
+                arrays['pair_slots']
+            )
+        return cls(tables, len(model.vocab), resolve_word=model.vocab.id_of, id_words=model.vocab.words,
+                   interval_configs=model.interval_configs)
+
+    @classmethod
+    def from_word_models(cls, word_models):
+        if isinstance(word_models, MappedWordModel):
+            return cls.from_mapped_model(word_models)
+        vocab = {}
+        pairs = {}
+        forward_totals = {}
+        for word, rows in word_models['forward'].items():
+            word_id = vocab.setdefault(word, len(vocab))
+            for fib_distance, row in rows.items():
+                left, right, counts = pairs.setdefault(fib_distance, ([], [], []))
+                for partner, count in row.items():
+                    left.append(word_id)
+                    right.append(vocab.setdefault(partner, len(vocab)))
+                    counts.append(count)
+                forward_totals.setdefault(fib_distance, {})[word_id] = sum(row.values())
+        backward_totals = {}
+        for word, rows in word_models['backward'].items():
+            word_id = vocab.setdefault(word, len(vocab))
+            for fib_distance, row in rows.items():
+                total = row.total() if hasattr(row, 'total') else sum(row.values())
+                backward_totals.setdefault(fib_distance, {})[word_id] = total
+        
+        def totals_array(totals):
+            array = np.zeros(len(vocab), dtype=np.float64)
+            array[list(totals)] = list(totals.values())
+            return array
+        
+        tables = {}
+        for fib_distance, (left, right, counts) in pairs.items():
+            codes = (np.array(left, dtype=np.int64) << 32) | np.array(right, dtype=np.int64)
+            order = np.argsort(codes)
+            tables[fib_distance] = (
+                codes[order], np.array(counts, dtype=np.float64)[order],
+                totals_array(forward_totals[fib_distance]),
+                totals_array(backward_totals.get(fib_distance, {})), None
+            )
+        return cls(tables, len(vocab), word_ids=vocab, interval_configs=getattr(word_models, 'interval_configs', None))
+
+    def encode(self, words):
+        # word ids, -1 for words the model has never seen; misses aren't remembered, so
+        # a long-running scorer's lookup can't grow with every unseen token it is sent
+        ids = self._ids
+        resolve = self._resolve_word
+        encoded = []
+        for word in words:
+            word_id = ids.get(word)
+            if word_id is None and resolve is not None:
+                word_id = resolve(word)
+                if word_id is not None:
+                    ids[word] = word_id
+            encoded.append(-1 if word_id is None else word_id)
+        return np.array(encoded, dtype=np.int64)
+
+    def words(self, word_ids):
+        if self._id_words is not None:
+            return self._id_words(word_ids)
+        return [self._word_list[i] for i in word_ids]
+
+    def entry_scores(self, fib_distance):
+        # left ids, right ids and forward_prob * backward_prob of every pair at fib_distance
+        codes, counts, forward_totals, backward_totals, slots = self.tables[fib_distance]
+        left_ids = codes >> 32
+        right_ids = codes & 0xFFFFFFFF
+        if slots is not None:
+            counts = counts[slots]
+        return left_ids, right_ids, (counts / forward_totals[left_ids]) * (counts / backward_totals[right_ids])
+
+    def pair_scores(self, fib_distance, left_ids, right_ids):
+        # forward_prob * backward_prob of each (left, right) pair at fib_distance, 0 if never seen
+        codes, counts, forward_totals, backward_totals, slots = self.tables[fib_distance]
+        scores = np.zeros(len(left_ids), dtype=np.float64)
+        known = (left_ids >= 0) & (right_ids >= 0)
+        if not known.any() or len(codes) == 0:
+            return scores
+        left_ids, right_ids = left_ids[known], right_ids[known]
+        wanted = (left_ids << 32) | right_ids
+        found = np.searchsorted(codes, wanted)
+        found[found == len(codes)] = 0
+        hit = codes[found] == wanted
+        pair_counts = counts[found[hit] if slots is None else slots[found[hit]]]
+        known_scores = np.zeros(len(wanted), dtype=np.float64)
+        known_scores[hit] = ((pair_counts / forward_totals[left_ids[hit]])
+                             * (pair_counts / backward_totals[right_ids[hit]]))
+        scores[known] = known_scores
+        return scores
+
+
+def pair_score_index(word_models, keep=True):
+    # Built once per model and kept on it where possible; plain dict models can't hold
+    # attributes, so callers scoring repeatedly should keep the returned index themselves.
+    # A mapped model only keeps an index that reads its mapping: for a file without pair
+    # codes, keeping it would pin a private copy of every pair for the model's lifetime.
+    # keep=False is for one-off uses: an index already kept is reused, a new one isn't kept.
+    if isinstance(word_models, PairScoreIndex):
+        return word_models
+    index = getattr(word_models, '_pair_score_index', None)
+    if index is None:
+        index = PairScoreIndex.from_word_models(word_models)
+        if not keep or (isinstance(word_models, MappedWordModel) and not word_models.has_pair_codes()):
+            return index
+        try:
+            word_models._pair_score_index = index
+        except AttributeError:
+            pass
+    return index
+
+
+class RelatedWordIndex:
+    # Per word, its top_m associated words by mutual score summed over distances and both
+    # directions (so the association is symmetric), as CSR rows sorted best first.
+    def __init__(self, words, indptr, partners, scores):
+        self.words = words
+        self.ids = {word: word_id for word_id, word in enumerate(words)}
+        self.indptr = indptr
+        self.partners = partners
+        self.scores = scores
+
+    @classmethod
+    def build(cls, word_models, top_m=100, fib_distances=None, weights=None):
+        # the pair index is only needed while building, so it isn't left on the model
+        index = pair_score_index(word_models, keep=False)
+        weights = weights or {}
+        codes, scores = [], []
+        for fib_distance in fib_distances or index.fib_distances:
+            if fib_distance not in index.tables:
+                continue
+            left_ids, right_ids, pair_scores = index.entry_scores(fib_distance)
+            pair_scores = pair_scores * weights.get(fib_distance, 1.0)
+            codes += [(left_ids << 32) | right_ids, (right_ids << 32) | left_ids]
+            scores += [pair_scores, pair_scores]
+        codes = np.concatenate(codes) if codes else np.zeros(0, dtype=np.int64)
+        scores = np.concatenate(scores) if scores else np.zeros(0, dtype=np.float64)
+        
+        codes, inverse = np.unique(codes, return_inverse=True)
+        totals = np.bincount(inverse, weights=scores, minlength=len(codes))
+        rows = codes >> 32
+        # best first within each row, lower partner id first on ties (codes are sorted)
+        order = np.lexsort((-totals, rows))
+        row_starts = np.searchsorted(rows, rows[order])
+        keep = order[(np.arange(len(order)) - row_starts) < top_m]
+        indptr = np.zeros(index.vocab_size + 1, dtype=np.int64)
+        np.cumsum(np.minimum(np.bincount(rows, minlength=index.vocab_size), top_m), out=indptr[1:])
+        partner_dtype = _smallest_dtype(max(index.vocab_size - 1, 0), (np.int32, np.int64))
+        return cls(index.words(range(index.vocab_size)), indptr,
+                   (codes[keep] & 0xFFFFFFFF).astype(partner_dtype), totals[keep])
+
+    def row(self, word_id):
+        start, end = self.indptr[word_id], self.indptr[word_id + 1]
+        return self.partners[start:end], self.scores[start:end]
+
+    def save(self, path):
+        encoded = [word.encode('utf-8') for word in self.words]
+        with open(path, 'wb') as f:
+            np.savez(
+                f, vocab_bytes=np.frombuffer(b''.join(encoded), dtype=np.uint8),
+                vocab_lengths=np.array([len(word) for word in encoded], dtype=np.int64),
+                indptr=self.indptr, partners=self.partners, scores=self.scores
+            )
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            vocab_bytes = data['vocab_bytes'].tobytes()
+            ends = np.cumsum(data['vocab_lengths']).tolist()
+            words = [vocab_bytes[start:end].decode('utf-8') for start, end in zip([0] + ends, ends)]
+            return cls(words, data['indptr'], data['partners'], data['scores'])
+
+
+def is_binary_word_model(path):
+    with open(path, 'rb') as f:
+        return f.read(len(BINARY_MAGIC)) == BINARY_MAGIC
+
+
+def load_word_model(path, top_k=None):
+    if is_binary_word_model(path):
+        return MappedWordModel(path, top_k=top_k)
+    with open(path, 'rb') as f:
+        word_models = pickle.load(f)
+    if top_k:
+        word_models = build_ranked_candidate_index(word_models, top_k)
+    return word_models
+
+
+def convert_pickle_model(pickle_path, binary_path, top_k=None, pair_codes=False):
+    with open(pickle_path, 'rb') as f:
+        word_models = pickle.load(f)
+    if isinstance(word_models, RankedWordModel):
+        word_models = word_models.base
+    save_word_model_binary(word_models, binary_path, top_k=top_k, pair_codes=pair_codes)
+    return MappedWordModel(binary_path)
+
+
+def _find_codes(haystack, needles):
+    # index of each needle in haystack, or -1
+    positions = np.full(len(needles), -1, dtype=np.int64)
+    if len(haystack) == 0:
+        return positions
+    order = np.argsort(haystack)
+    sorted_haystack = haystack[order]
+    found = np.searchsorted(sorted_haystack, needles)
+    found[found == len(sorted_haystack)] = 0
+    matches = sorted_haystack[found] == needles
+    positions[matches] = order[found[matches]]
+    return positions
+
+
+def merge_into_binary_word_model(model, delta_vocab_words, delta_tables, output_path):
+    # delta_tables: {fib_distance: (left_ids, right_ids, counts)} in first-occurrence order,
+    # ids into delta_vocab_words. Existing rows keep their order; new partners and new
+    # words are appended, which is where retraining over the extended corpus puts them.
+    missing = set(delta_tables) - set(model.fib_distances)
+    if missing:
+        raise ValueError(f"Delta has distances {sorted(missing)} that the model was not trained with")
+    
+    vocab_words = model.vocab.words(range(len(model.vocab)))
+    vocab = {word: word_id for word_id, word in enumerate(vocab_words)}
+    delta_ids = np.array([vocab.setdefault(word, len(vocab)) for word in delta_vocab_words], dtype=np.int64)
+    vocab_words.extend(list(vocab)[len(vocab_words):])
+    old_size = len(model.vocab)
+    
+    forward_words = model.array('forward_words').tolist()
+    backward_words = model.array('backward_words').tolist()
+    if delta_tables:
+        left, right, _ = delta_tables[min(delta_tables)]
+        for words, ids in ((forward_words, left), (backward_words, right)):
+            seen = set(words)
+            for word_id in delta_ids[np.asarray(ids, dtype=np.int64)].tolist():
+                if word_id not in seen:
+                    seen.add(word_id)
+                    words.append(word_id)
+    
+    distance_arrays = {}
+    for fib_distance in model.fib_distances:
+        indptr = model.array(f'forward_indptr_{fib_distance}')
+        old_left = np.repeat(np.arange(old_size), np.diff(indptr))
+        old_right = model.array(f'forward_partners_{fib_distance}').astype(np.int64)
+        old_counts = model.array(f'counts_{fib_distance}').astype(np.int64)
+        backward_indptr = model.array(f'backward_indptr_{fib_distance}')
+        backward_rows = np.repeat(np.arange(old_size), np.diff(backward_indptr))
+        backward_partners = model.array(f'backward_partners_{fib_distance}').astype(np.int64)
+        
+        if fib_distance in delta_tables:
+            left, right, counts = delta_tables[fib_distance]
+            left = delta_ids[np.asarray(left, dtype=np.int64)]
+            right = delta_ids[np.asarray(right, dtype=np.int64)]
+            counts = np.asarray(counts, dtype=np.int64)
+            positions = _find_codes((old_left << 32) | old_right, (left << 32) | right)
+            known = positions >= 0
+            np.add.at(old_counts, positions[known], counts[known])
+            new = ~known
+            old_left = np.concatenate((old_left, left[new]))
+            old_right = np.concatenate((old_right, right[new]))
+            old_counts = np.concatenate((old_counts, counts[new]))
+            backward_rows = np.concatenate((backward_rows, right[new]))
+            backward_partners = np.concatenate((backward_partners, left[new]))
+        
+        distance_arrays[fib_distance] = build_distance_arrays(
+            len(vocab_words), old_left, old_right, old_counts, backward_rows, backward_partners
+        )
+    
+    write_word_model_binary(output_path, vocab_words, forward_words, backward_words, distance_arrays,
+                            top_k=model.top_k, interval_configs=model.interval_configs,
+                            pair_codes=model.has_pair_codes())
+
+
+def prune_binary_word_model(model, output_path, min_count=1, top_n=None, min_word_count=0, count_bits=None):
+    # Drops pair entries below min_count, entries outside the top_n of both their forward and
+    # backward row, and words seen fewer than min_word_count times (pairs at the smallest
+    # distance, the closest thing to a word frequency the model keeps). Row totals are kept
+    # from the full model, so every surviving candidate scores exactly as before. count_bits
+    # stores counts in that many bits, saturating larger counts.
+    count_dtype = None
+    if count_bits:
+        count_dtype = np.dtype({8: np.uint8, 16: np.uint16, 32: np.uint32, 64: np.uint64}[count_bits])
+    
+    vocab_size = len(model.vocab)
+    smallest = min(model.fib_distances)
+    frequency = np.maximum(model.array(f'forward_totals_{smallest}'), model.array(f'backward_totals_{smallest}'))
+    keep_word = frequency >= min_word_count
+    new_ids = np.cumsum(keep_word) - 1
+    new_size = int(keep_word.sum())
+    
+    stats = {'entries_before': 0, 'entries_after': 0, 'saturated_counts': 0}
+    distance_arrays = {}
+    has_rows = {'forward': np.zeros(vocab_size, dtype=bool), 'backward': np.zeros(vocab_size, dtype=bool)}
+    for fib_distance in model.fib_distances:
+        arrays = model.distance_arrays(fib_distance)
+        counts = arrays['counts']
+        forward_rows = np.repeat(np.arange(vocab_size), np.diff(arrays['forward_indptr']))
+        backward_rows = np.repeat(np.arange(vocab_size), np.diff(arrays['backward_indptr']))
+        slots = arrays['backward_slots']
+        
+        keep = counts >= min_count
+        keep &= keep_word[forward_rows] & keep_word[arrays['forward_partners']]
+        if top_n:
+            ranked = ranked_index_arrays(arrays, top_n)
+            in_top = np.zeros(len(counts), dtype=bool)
+            in_top[ranked['ranked_forward_positions']] = True
+            in_top[slots[ranked['ranked_backward_positions']]] = True
+            keep &= in_top
+        
+        backward_keep = keep[slots]
+        new_slots = np.cumsum(keep) - 1
+        kept_counts = counts[keep]
+        stored_dtype = count_dtype or kept_counts.dtype
+        if count_dtype is not None:
+            limit = np.iinfo(count_dtype).max
+            stats['saturated_counts'] += int((kept_counts > limit).sum())
+            kept_counts = np.minimum(kept_counts, limit)
+        
+        forward_left = new_ids[forward_rows[keep]]
+        backward_left = new_ids[backward_rows[backward_keep]]
+        has_rows['forward'][forward_rows[keep]] = True
+        has_rows['backward'][backward_rows[backward_keep]] = True
+        forward_totals = arrays['forward_totals'][keep_word]
+        backward_totals = arrays['backward_totals'][keep_word]
+        total_dtype = _smallest_dtype(int(max(forward_totals.max(initial=0), backward_totals.max(initial=0))),
+                                      (np.uint32, np.uint64))
+        id_dtype = _smallest_dtype(max(new_size - 1, 0), (np.int32, np.int64))
+        distance_arrays[fib_distance] = {
+            'forward_indptr': _csr_indptr(forward_left, new_size),
+            'forward_partners': new_ids[arrays['forward_partners'][keep]].astype(id_dtype),
+            'counts': kept_counts.astype(stored_dtype),
+            'forward_totals': forward_totals.astype(total_dtype),
+            'backward_indptr': _csr_indptr(backward_left, new_size),
+            'backward_partners': new_ids[arrays['backward_partners'][backward_keep]].astype(id_dtype),
+            'backward_slots': new_slots[slots[backward_keep]].astype(
+                _smallest_dtype(len(kept_counts), (np.int32, np.int64))
+            ),
+            'backward_totals': backward_totals.astype(total_dtype),
+        }
+        stats['entries_before'] += len(counts)
+        stats['entries_after'] += len(kept_counts)
+    
+    outer_words = {}
+    for direction in ('forward', 'backward'):
+        word_ids = model.array(f'{direction}_words')
+        outer_words[direction] = new_ids[word_ids[has_rows[direction][word_ids]]]
+    vocab_words = model.vocab.words(np.flatnonzero(keep_word).tolist())
+    write_word_model_binary(
+        output_path, vocab_words, outer_words['forward'], outer_words['backward'],
+        distance_arrays, top_k=model.top_k, interval_configs=model.interval_configs,
+        pair_codes=model.has_pair_codes()
+    )
+    stats['vocab_before'] = vocab_size
+    stats['vocab_after'] = new_size
+    return stats
@@ -0,0 +1,243 @@
+#!/usr/bin/env python3
+import os
+import pickle
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_all_start_methods, get_context
+
+from create_models import (
+    WORD_PATTERN,
+    CandidateSampler,
+    generate_fibonacci_bidirectional_multi_words_batch,
+    generate_fibonacci_diffusion_words
+)
+from fibonacci_word_store import (
+    MappedWordModel,
+    RankedWordModel,
+    is_binary_word_model,
+    save_word_model_binary,
+    write_word_model_binary
+)
+
+
+# Set once per worker process by _init_worker; every task reads the model from here
+_worker_models = None
+
+
+def _init_worker(path, top_k):
+    global _worker_models
+    _worker_models = MappedWordModel(path, top_k=top_k)
+
+
+def _call_with_model(function, args, kwargs):
+    return function(_worker_models, *args, **kwargs)
+
+
+def _seeded_samplers(seed_word_lists, sampling, first_index):
+    # one sampler per chunk keeps its tables; its RNG is reseeded from each prompt's index in
+    # the whole job, so a seed gives the same samples however the prompts are chunked
+    seed = sampling.get('seed')
+    sampler = CandidateSampler(**sampling)
+    for index, seed_words in enumerate(seed_word_lists, first_index):
+        if seed is not None:
+            sampler.rng.seed(f'{seed}:{index}')
+        yield seed_words, sampler
+
+
+def _generate_chunk(word_models, seed_word_lists, length, intervals, sampling, first_index):
+    if sampling is None:
+        return generate_fibonacci_bidirectional_multi_words_batch(word_models, seed_word_lists, length, intervals)
+    sequences = []
+    for seed_words, sampler in _seeded_samplers(seed_word_lists, sampling, first_index):
+        sequences.extend(generate_fibonacci_bidirectional_multi_words_batch(
+            word_models, [seed_words], length, intervals, sampler
+        ))
+    return sequences
+
+
+def _diffusion_chunk(word_models, seed_word_lists, length, diffusion_steps, intervals, sampling, first_index):
+    if sampling is None:
+        prompts = ((seed_words, None) for seed_words in seed_word_lists)
+    else:
+        prompts = _seeded_samplers(seed_word_lists, sampling, first_index)
+    return [
+        generate_fibonacci_diffusion_words(word_models, seed_words, length, diffusion_steps, verbose=False,
+                                           analysis=False, intervals=intervals, sampler=sampler)[0]
+        for seed_words, sampler in prompts
+    ]
+
+
+def _worker_pid(wait):
+    # held for a moment so the tasks submitted together spread over the idle workers
+    time.sleep(wait)
+    return os.getpid()
+
+
+def shared_model_file(model, top_k=None, workdir=None):
+    # A binary file every worker can map: the page cache then holds the only copy of the
+    # counts. Pickled and in-memory models are written out once (into workdir); the second
+    # value says whether that file is temporary. A top_k index the file doesn't have is
+    # written into the file too, rather than built privately in every worker.
+    opened = None
+    if isinstance(model, (str, os.PathLike)):
+        if is_binary_word_model(model):
+            model = opened = MappedWordModel(os.fspath(model))
+        else:
+            with open(model, 'rb') as f:
+                model = pickle.load(f)
+    if isinstance(model, MappedWordModel) and (not top_k or model.header.get('top_k') == top_k):
+        if opened is not None:
+            opened.close()
+        return model.path, False
+
+    fd, path = tempfile.mkstemp(prefix='fibonacci_shared_', suffix='.bin', dir=workdir)
+    os.close(fd)
+    if isinstance(model, MappedWordModel):
+        write_word_model_binary(
+            path, model.vocab.words(range(len(model.vocab))),
+            model.array('forward_words'), model.array('backward_words'),
+            {fib_distance: model.distance_arrays(fib_distance) for fib_distance in model.fib_distances},
+            top_k=top_k or model.top_k, interval_configs=model.interval_configs
+        )
+    else:
+        if isinstance(model, RankedWordModel):
+            top_k = top_k or model.top_k
+            model = model.base
+        save_word_model_binary(model, path, top_k=top_k)
+    if opened is not None:
+        opened.close()
+    return path, True
+
+
+def process_memory_mb(pid='self'):
+    # Rss counts shared pages in full for every process; Pss splits them between the processes
+    # mapping them, so the Pss of a pool adds up to its real footprint
+    memory = {}
+    try:
+        with open(f'/proc/{pid}/smaps_rollup') as f:
+            for line in f:
+                field, _, value = line.partition(':')
+                if field in ('Rss', 'Pss'):
+                    memory[field.lower()] = int(value.split()[0]) / 1024
+    except OSError:
+        pass
+    return memory
+
+
+class WordModelPool:
+    # Worker processes that all map one binary model file, so the model's pages are
+    # shared instead of copied into every worker (a pickled dict model stops being shared
+    # after fork as soon as refcount updates touch its pages).
+    def __init__(self, model, workers=None, top_k=None, workdir=None, mp_context=None):
+        self.path, self._temporary = shared_model_file(model, top_k=top_k, workdir=workdir)
+        self.workers = workers or os.cpu_count() or 1
+        if mp_context is None:
+            # not fork: a forked worker would still reach the parent's own objects, and the
+            # garbage collector touching them copies their pages
+            mp_context = get_context('forkserver' if 'forkserver' in get_all_start_methods() else 'spawn')
+        self.executor = ProcessPoolExecutor(
+            max_workers=self.workers, mp_context=mp_context,
+            initializer=_init_worker, initargs=(self.path, top_k)
+        )
+
+    def submit(self, function, *args, **kwargs):
+        # runs function(word_models, *args, **kwargs) in a worker; function must be importable
+        return self.executor.submit(_call_with_model, function, args, kwargs)
+
+    def _chunks(self, items, chunk_size):
+        # (chunk, index of its first item in the whole job)
+        if chunk_size is None:
+            chunk_size = max(1, -(-len(items) // (4 * self.workers)))
+        return [(items[start:start + chunk_size], start) for start in range(0, len(items), chunk_size)]
+
+    def generate(self, seed_word_lists, length=20, intervals=None, sampling=None, chunk_size=None):
+        # sampling: CandidateSampler keyword arguments; with a seed, every prompt draws from
+        # its own stream, so repeated prompts differ and results don't depend on the workers
+        futures = [
+            self.submit(_generate_chunk, chunk, length, intervals, sampling, first_index)
+            for chunk, first_index in self._chunks(list(seed_word_lists), chunk_size)
+        ]
+        return [sequence for future in futures for sequence in future.result()]
+
+    def diffusion(self, seed_word_lists, length=20, diffusion_steps=3, intervals=None, sampling=None,
+                  chunk_size=None):
+        # sampling as in generate
+        futures = [
+            self.submit(_diffusion_chunk, chunk, length, diffusion_steps, intervals, sampling, first_index)
+            for chunk, first_index in self._chunks(list(seed_word_lists), chunk_size)
+        ]
+        return [sequence for future in futures for sequence in future.result()]
+
+    def worker_pids(self):
+        # asked of the workers themselves: only this pool's processes, not every child process
+        futures = [self.executor.submit(_worker_pid, 0.05) for _ in range(2 * self.workers)]
+        return sorted({future.result() for future in futures})
+
+    def memory_usage(self):
+        workers = [process_memory_mb(pid) for pid in self.worker_pids()]
+        return {
+            'parent': process_memory_mb(),
+            'workers': workers,
+            'total_rss_mb': round(sum(m.get('rss', 0) for m in workers), 1),
+            'total_pss_mb': round(sum(m.get('pss', 0) for m in workers), 1),
+        }
+
+    def close(self):
+        self.executor.shutdown()
+        if self._temporary and os.path.exists(self.path):
+            os.remove(self.path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def main(argv=None):
+    import argparse
+    import sys
+
+    parser = argparse.ArgumentParser(description="Generate from many prompts on a pool of workers sharing one model")
+    parser.add_argument('--model', required=True, help="binary or pickled word model")
+    parser.add_argument('--prompts', help="file with one prompt per line (default: stdin)")
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    parser.add_argument('--mode', choices=('multi', 'diffusion'), default='multi')
+    parser.add_argument('--length', type=int, default=20)
+    parser.add_argument('--diffusion-steps', type=int, default=3)
+    parser.add_argument('--intervals', help="named interval configuration to generate with")
+    parser.add_argument('--temperature', type=float, help="sample instead of taking the best candidate")
+    parser.add_argument('--top-p', type=float)
+    parser.add_argument('--seed', type=int)
+    parser.add_argument('--top-k', type=int, help="top-K candidate index, written into the shared file")
+    parser.add_argument('--workdir', help="where a pickled model is converted for sharing")
+    args = parser.parse_args(argv)
+    if args.temperature is None and (args.top_p is not None or args.seed is not None):
+        parser.error("--top-p and --seed need --temperature")
+
+    if args.prompts:
+        with open(args.prompts, encoding='utf-8') as f:
+            lines = f.read().splitlines()
+    else:
+        lines = sys.stdin.read().splitlines()
+    prompts = [WORD_PATTERN.findall(line.lower()) for line in lines if line.strip()]
+
+    sampling = None
+    if args.temperature is not None:
+        sampling = {'temperature': args.temperature, 'top_p': args.top_p, 'seed': args.seed}
+    print(f"📂 Sharing {args.model} with {args.workers} workers", file=sys.stderr)
+    with WordModelPool(args.model, workers=args.workers, top_k=args.top_k, workdir=args.workdir) as pool:
+        if args.mode == 'multi':
+            sequences = pool.generate(prompts, args.length, intervals=args.intervals, sampling=sampling)
+        else:
+            sequences = pool.diffusion(prompts, args.length, args.diffusion_steps, intervals=args.intervals,
+                                       sampling=sampling)
+        memory = pool.memory_usage()
+    for sequence in sequences:
+        print(' '.join(sequence))
+    print(f"🧠 Workers: {memory['total_rss_mb']} MB RSS, {memory['total_pss_mb']} MB PSS in total", file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()